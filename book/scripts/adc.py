@@ -0,0 +1,303 @@
+""" Analog to digital conversion simulator for ADC design sweeps
+
+a2d/mimic_analog_to_digital_conversion.ipynb samples one 9 Hz cosine at
+one sampling rate and quantizes it with one number of bits. Here all the
+combinations of channels x bit depths x sampling rates are simulated in
+one NumPy computation with arrays of shape
+
+    (channels, bits, samples)
+
+where the records of all the sampling rates are laid end to end on the
+samples axis. They are processed in chunks, so a long record does not
+have to fit in memory, and only running sums are kept for the metrics.
+
+The chain of every combination is:
+    sample and hold : the value at the sampling instant, optionally with
+                      an rms aperture jitter
+    dither          : none, rectangular (+-q/2) or triangular (+-q)
+    clipping        : to the input range [miny, maxy]
+    quantization    : N bits over the input range, q = (maxy - miny)/2^N
+
+    from adc import sweep
+    r = sweep(amplitudes=[[4.0]], frequencies=[[9.0]],
+              bits=[8, 12, 16], rates=[21, 100, 1000], duration=1.0)
+    r.snr, r.enob, r.alias_frequency
+
+adc() is the converter of a2d/create_plot_signal.ipynb, which the other
+a2d notebooks loaded by executing that notebook. It samples a dense record
+at any number of rates and bit depths in one call:
+
+    from adc import adc, alias_frequency
+    ts, yq, tr, yr = adc(t, y, fs=15, N=12, miny=0, maxy=10, method='soh')
+    r = adc(t, y, fs=[15, 11, 9, 6, 4], N=[4, 24], miny=0, maxy=10)
+    alias_frequency(10, [15, 11, 9, 6, 4])   # 5, 1, 1, 2, 2 Hz
+"""
+from collections import namedtuple
+
+import numpy as np
+
+
+def alias_frequency(f, fs):
+    """ apparent frequency of a tone f sampled at fs, in [0, fs/2]
+
+    |f - fs round(f/fs)|, e.g. a 10 Hz signal sampled at 6 Hz appears at 2 Hz
+    """
+    f = np.asarray(f, dtype=float)
+    fs = np.asarray(fs, dtype=float)
+    return np.abs(f - fs*np.round(f/fs))
+
+
+def quantize(y, bits, miny=-5., maxy=5., dither=None, rng=None):
+    """ clip and quantize y to `bits` over [miny, maxy]
+
+    bits broadcasts against y, e.g. bits[:, None] with y of shape (n,)
+    gives one row per bit depth. Codes are the mid-points of the 2^N
+    levels. dither: None, 'rectangular' or 'triangular'
+    """
+    q = (maxy - miny)/2.0**np.asarray(bits)
+    y = np.asarray(y, dtype=float)
+    if dither is not None:
+        rng = np.random.default_rng() if rng is None else rng
+        shape = np.broadcast_shapes(y.shape, np.shape(q))
+        if dither == 'rectangular':
+            y = y + q*rng.uniform(-0.5, 0.5, shape)
+        elif dither == 'triangular':
+            y = y + q*(rng.uniform(-0.5, 0.5, shape)
+                       + rng.uniform(-0.5, 0.5, shape))
+        else:
+            raise ValueError('dither must be None, rectangular or triangular')
+    code = np.floor((np.clip(y, miny, maxy) - miny)/q)
+    code = np.minimum(code, 2.0**np.asarray(bits) - 1)
+    return miny + (code + 0.5)*q
+
+
+ADCRecords = namedtuple('ADCRecords', ['ts', 'yq', 'tr', 'yr', 'offsets'])
+ADCRecords.__doc__ = """ adc() at several rates: the records of all rates
+end to end, ts[offsets[i]:offsets[i + 1]] is rate i, yq is (bits, samples),
+tr and yr the reconstruction (yr is (bits, rates, t.size) for 'soh' and
+'zoh', tr = ts and yr = yq for None); padded() gives a (rates, n) array """
+
+
+def padded(values, offsets, fill=np.nan):
+    """ the ragged records (..., samples) as (..., rates, longest) """
+    values = np.asarray(values)
+    n = np.diff(offsets)
+    rate = np.repeat(np.arange(n.size), n)
+    k = np.arange(offsets[-1]) - offsets[rate]
+    out = np.full(values.shape[:-1] + (n.size, n.max(initial=0)), fill,
+                  dtype=np.result_type(values, fill))
+    out[..., rate, k] = values
+    return out
+
+
+def adc(t, y, fs=1., N=4, miny=-5., maxy=5., method=None):
+    """ A/D conversion of a dense record at every rate fs and bits N
+
+    Inputs:
+        t - time [s], array of floats, increasing
+        y - signal [V], array of floats
+        fs - sampling frequency [Hz], scalar or array
+        N - number of bits of the A/D converter, scalar or array
+        miny, maxy - lowest, highest values [V], default -5 ..+5 [Volt]
+        method - the reconstruction: 'soh' - sample and hold on t, 'zoh'
+            - the samples at the nearest t and zero elsewhere, or None
+
+    Outputs:
+        scalar fs and N, as the notebook:
+            ts - sampled times [s], np.arange(t[0], t[-1], 1/fs)
+            yq - sampled, clipped and quantized signal [V]
+            tr, yr - reconstructed signal, t and yr for 'soh' and 'zoh',
+                ts and yq for None
+        arrays: ADCRecords with the records of all rates end to end
+
+    The samples of all the rates are interpolated from y in one call and
+    quantized for all bit depths at once with quantize().
+    """
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    scalar = np.ndim(fs) == 0 and np.ndim(N) == 0
+    fs = np.atleast_1d(np.asarray(fs, dtype=float))
+    bits = np.atleast_1d(np.asarray(N))
+
+    # sample: the ragged records of all rates laid end to end
+    n = np.ceil((t[-1] - t[0])*fs).astype(int)
+    offsets = np.r_[0, np.cumsum(n)]
+    rate = np.repeat(np.arange(fs.size), n)
+    k = np.arange(offsets[-1]) - offsets[rate]
+    ts = t[0] + k/fs[rate]
+    ys = np.interp(ts, t, y, left=0.0, right=0.0)
+    yq = quantize(ys, bits[:, None], miny, maxy)
+
+    if method == 'soh':
+        # index of the last sample at or before every t, per rate
+        last = np.floor((t - t[0])*fs[:, None]).astype(int)
+        last += t[0] + (last + 1)/fs[:, None] <= t
+        last -= t[0] + last/fs[:, None] > t
+        last = offsets[:-1, None] + np.clip(last, 0, n[:, None] - 1)
+        tr, yr = t, yq[:, last]
+    elif method == 'zoh':
+        # every sample at the nearest t
+        i = np.clip(np.searchsorted(t, ts), 1, t.size - 1)
+        i -= ts - t[i - 1] <= t[i] - ts
+        tr = t
+        yr = np.zeros((bits.size, fs.size, t.size))
+        yr[:, rate, i] = yq
+    elif method is None:
+        tr, yr = ts, yq
+    else:
+        raise ValueError("method must be 'soh', 'zoh' or None")
+
+    if scalar:
+        return ts, yq[0], tr, yr[0] if method is None else yr[0, 0]
+    return ADCRecords(ts, yq, tr, yr, offsets)
+
+
+ADCSweep = namedtuple('ADCSweep',
+                      ['snr', 'enob', 'clipped', 'samples',
+                       'alias_frequency', 'aliased'])
+ADCSweep.__doc__ = """ snr [dB], enob and the fraction of clipped samples
+for every (channel, bits, rate), samples per rate, and the apparent
+frequency of every (channel, tone, rate) with the flag f > fs/2 """
+
+
+def sweep(amplitudes, frequencies, bits, rates, duration=1.0, offsets=0.0,
+          phases=0.0, miny=-5., maxy=5., dither=None, jitter=0.0,
+          chunk_size=2**14, seed=None):
+    """ simulate every channel at every bit depth and sampling rate
+
+    Inputs:
+        amplitudes, frequencies : (channels, tones) sine components [V], [Hz]
+        bits : (n_bits,) bit depths, e.g. np.arange(8, 25)
+        rates : (n_rates,) sampling frequencies [Hz]
+        duration : length of the record [s], equal for all rates
+        offsets : (channels,) DC [V]
+        phases : (channels, tones) [rad]
+        miny, maxy : input range of the converter [V]
+        dither : None, 'rectangular' or 'triangular'
+        jitter : rms aperture jitter of the sample and hold [s]
+        chunk_size : samples (of all rates together) processed at once
+
+    Returns:
+        ADCSweep, SNR is the power of the sampled signal (without DC) over
+        the power of the error (quantization, clipping, dither, jitter),
+        ENOB = (SNR - 1.76)/6.02 as for a full scale sine
+    """
+    a = np.atleast_2d(np.asarray(amplitudes, dtype=float))
+    f = np.broadcast_to(np.asarray(frequencies, dtype=float), a.shape)
+    ph = np.broadcast_to(np.asarray(phases, dtype=float), a.shape)
+    dc = np.broadcast_to(np.asarray(offsets, dtype=float), a.shape[:1])
+    bits = np.atleast_1d(np.asarray(bits))
+    rates = np.atleast_1d(np.asarray(rates, dtype=float))
+    rng = np.random.default_rng(seed)
+
+    # the records of all rates are laid end to end on one sample axis,
+    # starts[i] is where rate i starts, no padding is computed
+    n_samples = np.ceil(duration*rates).astype(int)
+    starts = np.r_[0, np.cumsum(n_samples)]
+    shape = (a.shape[0], bits.size, rates.size)
+    sum_y = np.zeros(shape[::2])       # (channels, rates)
+    sum_y2 = np.zeros(shape[::2])
+    sum_e2 = np.zeros(shape)
+    clipped = np.zeros(shape)
+
+    b = bits[:, None]
+    A, F, P = a[:, :, None], 2*np.pi*f[:, :, None], ph[:, :, None]
+    for start in range(0, starts[-1], chunk_size):
+        idx = np.arange(start, min(start + chunk_size, starts[-1]))
+        rate = np.searchsorted(starts, idx, side='right') - 1
+        t = (idx - starts[rate])/rates[rate]
+        ts = t if not jitter else t + jitter*rng.standard_normal(t.shape)
+
+        # (channels, chunk), the tones are summed
+        y = dc[:, None] + np.sum(A*np.sin(F*ts + P), axis=1)
+        ideal = y if not jitter else dc[:, None] + np.sum(
+            A*np.sin(F*t + P), axis=1)
+
+        # (channels, bits, chunk)
+        yq = quantize(y[:, None], b, miny, maxy, dither, rng)
+        e2 = (yq - ideal[:, None])**2
+        out = ((y < miny) | (y > maxy)).astype(float)
+
+        # sums over the pieces of the chunk that belong to each rate
+        first = np.flatnonzero(np.r_[True, np.diff(rate) > 0])
+        r = rate[first]
+        sum_e2[:, :, r] += np.add.reduceat(e2, first, axis=-1)
+        clipped[:, :, r] += np.add.reduceat(out, first, axis=-1)[:, None]
+        sum_y[:, r] += np.add.reduceat(ideal, first, axis=-1)
+        sum_y2[:, r] += np.add.reduceat(ideal**2, first, axis=-1)
+
+    n = n_samples.astype(float)
+    p_signal = sum_y2/n - (sum_y/n)**2
+    with np.errstate(divide='ignore'):
+        snr = 10*np.log10(p_signal[:, None]/(sum_e2/n))
+    enob = (snr - 1.76)/6.02
+
+    fa = alias_frequency(f[:, :, None], rates)
+    return ADCSweep(snr, enob, clipped/n, n_samples, fa,
+                    f[:, :, None] > rates/2)
+
+
+if __name__ == '__main__':
+    import time
+
+    # the notebook case: 9 Hz, 1 V, 4 bits over +-1 V, sampled at 21 Hz
+    r = sweep([[1.0]], [[9.0]], bits=[4], rates=[21.0], miny=-1, maxy=1)
+    print('4 bits: SNR = %.1f dB, ENOB = %.2f' % (r.snr[0, 0, 0],
+                                                 r.enob[0, 0, 0]))
+
+    # ideal quantizer of a full scale sine: SNR = 6.02 N + 1.76 dB
+    bits = np.arange(8, 25)
+    r = sweep([[4.99]], [[9.123]], bits=bits, rates=[1000.0])
+    np.testing.assert_allclose(r.enob[0, :, 0], bits, atol=0.1)
+
+    # 16 channels x 17 bit depths x 24 rates, 10 s each, with dither
+    rng = np.random.default_rng(6)
+    amplitudes = rng.uniform(0.5, 5.5, (16, 2))
+    frequencies = rng.uniform(5, 200, (16, 2))
+    rates = np.geomspace(50, 5000, 24)
+    tic = time.perf_counter()
+    r = sweep(amplitudes, frequencies, bits, rates, duration=10.0,
+              dither='triangular', jitter=1e-6, seed=0)
+    print('%d combinations, %d samples in %.2f s'
+          % (r.snr.size, np.sum(r.samples)*16*bits.size,
+             time.perf_counter() - tic))
+    print('aliased (channel, tone, rate) combinations: %d of %d'
+          % (r.aliased.sum(), r.aliased.size))
+    print('10 Hz at 6 Hz appears at %.1f Hz' % alias_frequency(10, 6))
+
+    # create_plot_signal.ipynb and sampling_aliasing_examples.ipynb
+    from scipy.interpolate import interp1d
+
+    t = np.linspace(0, 1, 1000)
+    y = 3 + 3*np.sin(2*np.pi*10*t)
+    rates = np.array([15., 11., 9., 6., 4.])
+    r = adc(t, y, fs=rates, N=[4, 12, 24], miny=0, maxy=10, method='soh')
+    for i, fs in enumerate(rates):
+        ts, yq, tr, yr = adc(t, y, fs=fs, N=12, miny=0, maxy=10,
+                             method='soh')
+        np.testing.assert_allclose(ts, np.arange(t[0], t[-1], 1/fs))
+        np.testing.assert_array_equal(ts, r.ts[r.offsets[i]:r.offsets[i + 1]])
+        np.testing.assert_array_equal(yq, r.yq[1, r.offsets[i]:
+                                               r.offsets[i + 1]])
+        soh = interp1d(ts, yq, kind='zero', bounds_error=False,
+                       fill_value=yq[-1])
+        np.testing.assert_array_equal(yr, soh(t))
+        np.testing.assert_array_equal(yr, r.yr[1, i])
+    print('records of', np.diff(r.offsets), 'samples, padded to',
+          padded(r.yq, r.offsets).shape)
+    print('10 Hz appears at', alias_frequency(10, rates), 'Hz')
+
+    # zero hold: the samples at the nearest instants
+    ts, yq, tr, yr = adc(t, y, fs=6, N=24, miny=0, maxy=10, method='zoh')
+    index = np.abs(np.subtract.outer(tr, ts)).argmin(0)
+    np.testing.assert_array_equal(yr[index], yq)
+    assert np.count_nonzero(yr) == ts.size
+
+    # 200 rates x 17 bit depths from a record of 10^6 points
+    t = np.linspace(0, 10, 10**6)
+    y = 5 + 4*np.sin(2*np.pi*9*t)
+    tic = time.perf_counter()
+    r = adc(t, y, fs=np.geomspace(10, 1e4, 200), N=bits, miny=0, maxy=10)
+    print('%d rates x %d bits, %d samples in %.2f s'
+          % (r.offsets.size - 1, bits.size, r.offsets[-1],
+             time.perf_counter() - tic))
@@ -0,0 +1,155 @@
+""" Batched linear calibration q_o = m q_i + b of many sensors at once
+
+All sensors are fitted in one vectorized pass over stacked
+(n_sensors, n_points) arrays, following the formulas of
+calibration/full_calibration_analysis_example.ipynb:
+
+    S_yx^2 = 1/nu sum (y_i - y_c_i)^2,  nu = N - (m+1)
+    q_i = (q_o - b)/m
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from stat_tables import t_value
+
+
+CalibrationFit = namedtuple(
+    'CalibrationFit',
+    ['m', 'b', 'syx', 'Sm', 'Sb', 'dm', 'db', 'N', 'nu', 'tvalue',
+     'xmean', 'Sxx'])
+CalibrationFit.__doc__ = """ per-sensor arrays of slope m, intercept b,
+standard error of the estimate syx, standard errors Sm, Sb and their
+t-based confidence half widths dm, db """
+
+
+def fit_calibration(x, y, confidence=0.95):
+    """ least squares lines for every row of y
+
+    Inputs:
+        x : (n_points,) inputs shared by all sensors, or (n_sensors, n_points)
+        y : (n_sensors, n_points) outputs
+        confidence : level of the t-based confidence intervals
+
+    Returns:
+        CalibrationFit of (n_sensors,) arrays
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    N = y.shape[-1]
+    nu = N - 2
+    if nu < 1:
+        raise ValueError('at least 3 points per sensor are needed')
+
+    xmean = x.mean(axis=-1)
+    ymean = y.mean(axis=-1)
+    xc = x - xmean[:, None]
+    yc = y - ymean[:, None]
+    Sxx = np.einsum('ij,ij->i', xc, xc)
+    Sxy = np.einsum('ij,ij->i', xc, yc)
+    Syy = np.einsum('ij,ij->i', yc, yc)
+
+    m = Sxy / Sxx
+    b = ymean - m * xmean
+    residual = np.maximum(Syy - m * Sxy, 0.0)
+    syx = np.sqrt(residual / nu)
+
+    Sm = syx / np.sqrt(Sxx)
+    Sb = syx * np.sqrt(1.0/N + xmean**2/Sxx)
+    tvalue = t_value(confidence, nu)
+
+    return CalibrationFit(m, b, syx, Sm, Sb, tvalue*Sm, tvalue*Sb,
+                          N, nu, tvalue, xmean, Sxx)
+
+
+def _column(a):
+    """ per-sensor (n_sensors,) array as a (n_sensors, 1) column """
+    return a.reshape(-1, 1)
+
+
+def confidence_band(fit, x0):
+    """ half width of the confidence interval of the fitted line at x0
+
+    x0 broadcasts against (n_sensors, 1): (k,) levels shared by all the
+    sensors or (n_sensors, k) levels per sensor, give one level per sensor
+    as (n_sensors, 1). Returns (n_sensors, k)
+    """
+    x0 = np.asarray(x0, dtype=float)
+    return fit.tvalue * _column(fit.syx) * np.sqrt(
+        1.0/fit.N + (x0 - _column(fit.xmean))**2/_column(fit.Sxx))
+
+
+def inverse_estimate(fit, q_o, repeats=1):
+    """ input estimate q_i = (q_o - b)/m and its standard uncertainty
+
+    The uncertainty of the inverse prediction from `repeats` readings
+    averaged into q_o includes the scatter of the reading and the
+    uncertainty of the calibration line:
+
+        s_qi = syx/|m| sqrt(1/repeats + 1/N + (q_i - x_mean)^2/Sxx)
+
+    which reduces to std_q0/m of the notebooks for large N
+
+    q_o broadcasts against (n_sensors, 1) as x0 of confidence_band():
+    (k,) readings shared by all the sensors, (n_sensors, k) per sensor
+
+    Returns:
+        q_i, s_qi of shape (n_sensors, k)
+    """
+    q_o = np.asarray(q_o, dtype=float)
+    m = _column(fit.m)
+    q_i = (q_o - _column(fit.b)) / m
+    s_qi = _column(fit.syx) / np.abs(m) * np.sqrt(
+        1.0/repeats + 1.0/fit.N
+        + (q_i - _column(fit.xmean))**2/_column(fit.Sxx))
+    return q_i, s_qi
+
+
+if __name__ == '__main__':
+    import time
+    from linear_regression import linreg
+
+    # the pressure transducer of full_calibration_analysis_example.ipynb
+    p_in = np.linspace(0.0, 10.0, 11)
+    x = np.r_[p_in, p_in[::-1]]
+    y = np.r_[[-1.12, 0.21, 1.18, 2.09, 3.33, 4.50, 5.26, 6.59, 7.73, 8.68,
+               9.8],
+              [10.20, 9.10, 7.92, 6.89, 5.87, 4.71, 3.62, 2.48, 1.65, 0.42,
+               -0.69]]
+    fit = fit_calibration(x, y)
+    q_i, s_qi = inverse_estimate(fit, 4.32)
+    print('m = %.2f +- %.2f, b = %.2f +- %.2f kPa'
+          % (fit.m[0], fit.dm[0], fit.b[0], fit.db[0]))
+    print('q_i = %.2f +- %.2f kPa' % (q_i[0, 0], 3*s_qi[0, 0]))
+
+    # a rack of transducers
+    rng = np.random.default_rng(1)
+    n_sensors = 2000
+    m_true = rng.normal(1.08, 0.02, (n_sensors, 1))
+    b_true = rng.normal(-0.85, 0.1, (n_sensors, 1))
+    Y = m_true * x + b_true + rng.normal(0, 0.2, (n_sensors, x.size))
+
+    tic = time.perf_counter()
+    fit = fit_calibration(x, Y)
+    band = confidence_band(fit, p_in)
+    q_i, s_qi = inverse_estimate(fit, [2.0, 5.0, 8.0])
+    t_batch = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    loop = np.array([linreg(x, yy, verbose=False) for yy in Y])
+    t_loop = time.perf_counter() - tic
+
+    np.testing.assert_allclose(fit.m, loop[:, 0])
+    np.testing.assert_allclose(fit.b, loop[:, 1])
+    np.testing.assert_allclose(fit.syx, loop[:, 3])
+    print('%d sensors: batched %.4f s, linreg loop %.4f s, speedup x%.0f'
+          % (n_sensors, t_batch, t_loop, t_loop/t_batch))
+
+    # one reading per sensor, as a column: one estimate per sensor
+    readings = fit.m*5.0 + fit.b
+    q_i, s_qi = inverse_estimate(fit, readings[:, None])
+    assert q_i.shape == s_qi.shape == (n_sensors, 1)
+    np.testing.assert_allclose(q_i[:, 0], 5.0)
+    assert confidence_band(fit, Y[:, :5]).shape == (n_sensors, 5)
+    at_3 = confidence_band(fit, np.full((n_sensors, 1), 3.0))
+    np.testing.assert_allclose(at_3[:, 0], band[:, 3])
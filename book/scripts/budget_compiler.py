@@ -0,0 +1,175 @@
+""" Compile a measurement equation into a vectorized uncertainty budget
+
+The sensitivity coefficients c_i = dY/dx_i of theory/Sensitivity_Coefficients_Uncertainty.md
+are derived once with sympy, the value and all the partial derivatives
+are turned into one NumPy function (common subexpressions are computed
+once) and the combined standard uncertainty
+
+    u_c = sqrt( sum (c_i u_i)^2 )
+
+is evaluated over arrays of operating points at NumPy speed:
+
+    import sympy as sp
+    from budget_compiler import compile_budget
+
+    h1, L, theta = sp.symbols('h1 L theta')
+    budget = compile_budget(h1 + L*sp.tan(theta), [h1, L, theta])
+    r = budget.evaluate({'h1': 1.5, 'L': 20.0, 'theta': angles},
+                        {'h1': 0.005, 'L': 0.02, 'theta': 0.002})
+    r.y, r.uc, r.contributions
+
+The generated source is cached on disk under the hash of the expression,
+so the symbolic work is skipped in the next sessions.
+"""
+import hashlib
+import inspect
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import sympy as sp
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '.budgetcache')
+
+BudgetResult = namedtuple('BudgetResult',
+                          ['y', 'uc', 'c', 'contributions', 'percent'])
+BudgetResult.__doc__ = """ value y, combined standard uncertainty uc,
+sensitivity coefficients c and contributions c_i u_i (first axis runs over
+the inputs), percent is the share of each source in uc^2 """
+
+
+class Budget:
+    """ compiled measurement equation, see compile_budget() """
+
+    def __init__(self, names, kernel, expression):
+        self.names = names
+        self.kernel = kernel
+        self.expression = expression
+
+    def sensitivities(self, values):
+        """ value and the coefficients c_i at the operating points """
+        out = self.kernel(*[values[name] for name in self.names])
+        out = np.broadcast_arrays(*[np.asarray(o, dtype=float) for o in out])
+        return out[0], np.stack(out[1:])
+
+    def evaluate(self, values, uncertainties):
+        """ y and u_c for the operating points
+
+        Inputs:
+            values : dict name -> value or array of operating points
+            uncertainties : dict name -> standard uncertainty u_i (scalar or
+                array broadcasting with the values), missing names are exact
+
+        Returns:
+            BudgetResult
+        """
+        y, c = self.sensitivities(values)
+        u = [np.asarray(uncertainties.get(name, 0.0), dtype=float)
+             for name in self.names]
+        # every u_i broadcasts against the operating points (from the right)
+        shape = np.broadcast_shapes(y.shape, *[ui.shape for ui in u])
+        u = np.stack([np.broadcast_to(ui, shape) for ui in u])
+        c = np.broadcast_to(c, u.shape)
+        y = np.broadcast_to(y, shape)
+        contributions = c*u
+        uc2 = np.sum(contributions**2, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percent = 100*contributions**2/uc2
+        return BudgetResult(y, np.sqrt(uc2), c, contributions, percent)
+
+
+_compiled = {}
+
+
+def _key(expression, symbols):
+    text = sp.srepr(expression) + '|' + ','.join(sp.srepr(s) for s in symbols)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _namespace():
+    # the names that lambdify puts at the disposal of generated numpy code
+    return dict(sp.lambdify([], 0, modules='numpy').__globals__)
+
+
+def compile_budget(expression, symbols, cache_dir=CACHE_DIR):
+    """ differentiate once and build the fused NumPy kernel
+
+    Inputs:
+        expression : sympy expression of the measurand Y
+        symbols : list of the input quantities, sympy Symbols
+        cache_dir : folder of the generated sources, None disables the disk
+            cache
+
+    Returns:
+        Budget
+    """
+    symbols = list(symbols)
+    names = [str(s) for s in symbols]
+    key = _key(expression, symbols)
+    if key in _compiled:
+        return _compiled[key]
+
+    path = None if cache_dir is None else os.path.join(cache_dir, key + '.py')
+    source = None
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            source = f.read()
+    else:
+        outputs = [expression] + [sp.diff(expression, s) for s in symbols]
+        kernel = sp.lambdify(symbols, outputs, modules='numpy', cse=True)
+        source = inspect.getsource(kernel)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                f.write(source)
+            os.replace(path + '.tmp', path)
+
+    namespace = dict(_namespace())
+    exec(source, namespace)
+    budget = Budget(names, namespace['_lambdifygenerated'], expression)
+    _compiled[key] = budget
+    return budget
+
+
+if __name__ == '__main__':
+    import time
+
+    # the building height of Sensitivity_Coefficients_Uncertainty.md
+    h1, L, theta = sp.symbols('h1 L theta')
+    tic = time.perf_counter()
+    budget = compile_budget(h1 + L*sp.tan(theta), [h1, L, theta])
+    print('compile %.4f s' % (time.perf_counter() - tic))
+
+    angles = np.radians(np.linspace(5, 80, 500_000))
+    u = {'h1': 0.005, 'L': 0.02, 'theta': np.radians(0.1)}
+    tic = time.perf_counter()
+    r = budget.evaluate({'h1': 1.5, 'L': 20.0, 'theta': angles}, u)
+    print('%d operating points in %.4f s' % (angles.size,
+                                             time.perf_counter() - tic))
+
+    np.testing.assert_allclose(r.c[2], 20.0/np.cos(angles)**2)
+    np.testing.assert_allclose(
+        r.uc, np.sqrt(0.005**2 + (np.tan(angles)*0.02)**2
+                      + (20.0/np.cos(angles)**2*u['theta'])**2))
+    for angle in (10, 45, 80):
+        i = np.argmin(np.abs(angles - np.radians(angle)))
+        print('theta = %2d deg: H = %7.2f +- %.3f m, %% of u_c^2: %s'
+              % (angle, r.y[i], r.uc[i], np.round(r.percent[:, i], 1)))
+
+    # volume of a cylinder V = pi D^2 H / 4
+    D, H = sp.symbols('D H')
+    r = compile_budget(sp.pi*D**2*H/4, [D, H]).evaluate(
+        {'D': np.linspace(9.9, 10.1, 5)[:, None], 'H': np.linspace(20, 30, 3)},
+        {'D': 0.01, 'H': 0.02})
+    print('cylinder u_c:', r.uc.shape)
+
+    # per-point uncertainty of H along its own axis
+    r2 = compile_budget(sp.pi*D**2*H/4, [D, H]).evaluate(
+        {'D': np.linspace(9.9, 10.1, 5)[:, None], 'H': np.linspace(20, 30, 3)},
+        {'D': 0.01, 'H': np.array([0.02, 0.02, 0.05])})
+    assert r2.uc.shape == (5, 3)
+    np.testing.assert_allclose(r2.uc[:, :2], r.uc[:, :2])
+    assert np.all(r2.uc[:, 2] > r.uc[:, 2])
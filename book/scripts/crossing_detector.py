@@ -0,0 +1,159 @@
+""" Streaming detector of rising threshold crossings and their periods
+
+find_transition_times() of signal_processing/proving_periods.ipynb works
+on a whole array: the crossings between two chunks of a long record are
+lost, and noise around the threshold gives many false crossings. The
+CrossingDetector keeps the last sample and the state of a Schmitt trigger
+from one chunk to the next:
+
+    det = CrossingDetector(fs, threshold=2.5, hysteresis=0.5)
+    for chunk in encoder:
+        times = det.update(chunk)       # interpolated crossing times [s]
+    det.stats()                         # count, mean, std, min, max period
+
+A rising crossing is counted when the signal reaches threshold after it
+has been below threshold - hysteresis, the time is interpolated linearly
+between the two samples around the threshold, as in the notebook. With
+hysteresis=0 the result is that of find_transition_times(). The memory in
+use is a few arrays of the chunk length, the period statistics are
+updated with the Welford/Chan formulas.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+PeriodStats = namedtuple('PeriodStats',
+                         ['count', 'mean', 'std', 'min', 'max', 'frequency'])
+PeriodStats.__doc__ = """ number of periods, their mean, standard deviation
+(ddof=1), shortest and longest [s], and the mean frequency 1/mean [Hz] """
+
+
+def find_transition_times(t, y, threshold):
+    """ the rising crossings of a whole record, proving_periods.ipynb """
+    lower = y < threshold
+    higher = y >= threshold
+    i = np.where(lower[:-1] & higher[1:])[0]
+    slope = (y[i + 1] - y[i])/(t[i + 1] - t[i])
+    return t[i] + (threshold - y[i])/slope
+
+
+class CrossingDetector:
+    """ rising crossings of a sampled signal given in chunks
+
+    fs : sampling frequency [Hz]
+    threshold : level of the crossing
+    hysteresis : the signal has to fall below threshold - hysteresis
+        before the next crossing is counted
+    t0 : time of the first sample [s]
+    """
+
+    def __init__(self, fs, threshold, hysteresis=0.0, t0=0.0):
+        self.fs = float(fs)
+        self.high = threshold
+        self.low = threshold - hysteresis
+        self.t0 = t0
+        self.n = 0              # samples seen
+        self._last = None       # last sample and trigger state
+        self._state = True
+        self._last_time = None  # last crossing
+        self._count = 0         # periods: count, mean, M2, min, max
+        self._mean = self._M2 = 0.0
+        self._min, self._max = np.inf, -np.inf
+
+    def update(self, y):
+        """ crossing times [s] within the chunk y (and its predecessor) """
+        y = np.asarray(y, dtype=float).ravel()
+        if y.size == 0:
+            return np.empty(0)
+        if self._last is None:
+            ext, start = y, self.n
+            first = 1 if y[0] >= self.high else (0 if y[0] < self.low else 1)
+        else:
+            ext, start = np.r_[self._last, y], self.n - 1
+            first = int(self._state)
+
+        # Schmitt trigger: 1 at or above high, 0 below low, else unchanged
+        code = np.full(ext.size, -1, dtype=np.int8)
+        code[ext >= self.high] = 1
+        code[ext < self.low] = 0
+        code[0] = first
+        pos = np.where(code >= 0, np.arange(ext.size), 0)
+        np.maximum.accumulate(pos, out=pos)
+        state = code[pos].astype(bool)
+        i = np.flatnonzero(state[1:] & ~state[:-1]) + 1
+
+        y0, y1 = ext[i - 1], ext[i]
+        times = self.t0 + (start + i - 1 + (self.high - y0)/(y1 - y0))/self.fs
+
+        self._last, self._state = ext[-1], state[-1]
+        self.n += y.size
+        self._add_periods(times)
+        return times
+
+    def _add_periods(self, times):
+        if times.size == 0:
+            return
+        if self._last_time is not None:
+            p = np.diff(np.r_[self._last_time, times])
+        else:
+            p = np.diff(times)
+        self._last_time = times[-1]
+        if p.size == 0:
+            return
+        n = self._count + p.size
+        mean = p.mean()
+        d = mean - self._mean
+        self._M2 += np.sum((p - mean)**2) + d*d*self._count*p.size/n
+        self._mean += d*p.size/n
+        self._count = n
+        self._min, self._max = min(self._min, p.min()), max(self._max,
+                                                            p.max())
+
+    def stats(self):
+        """ PeriodStats of all the periods so far """
+        std = np.sqrt(self._M2/(self._count - 1)) if self._count > 1 \
+            else np.nan
+        mean = self._mean if self._count else np.nan
+        return PeriodStats(self._count, mean, std, self._min, self._max,
+                           1./mean)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    # the notebook: a noisy sine, crossings of the whole array
+    rng = np.random.default_rng(21)
+    t = np.linspace(0, 50, 501)
+    y = 2.5 + 2*np.sin(2*np.pi*t/7.5) + 0.1*rng.normal(size=t.size)
+    reference = find_transition_times(t, y, 2.5)
+    det = CrossingDetector(1/(t[1] - t[0]), 2.5)
+    times = np.concatenate([det.update(c) for c in np.array_split(y, 13)])
+    np.testing.assert_allclose(times, reference)
+
+    # noise chatter: without hysteresis many false crossings
+    y = 2.5 + 2*np.sin(2*np.pi*np.arange(10**5)/1000) + \
+        0.1*rng.normal(size=10**5)
+    plain = CrossingDetector(1e3, 2.5).update(y)
+    schmitt = CrossingDetector(1e3, 2.5, 1.0).update(y)
+    print('crossings of 100 periods: %d without, %d with hysteresis'
+          % (plain.size, schmitt.size))
+    assert schmitt.size == 100
+
+    # encoder at 1 MHz, 1 kHz pulses, chunks of 2^20 samples; the chunk
+    # holds a whole number of periods and is repeated
+    samples = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10**8
+    chunk = 2**20
+    period = chunk/1024                 # 1024 samples
+    k = np.arange(chunk)
+    block = (np.sin(2*np.pi*k/period) > 0)*5.0 + 0.3*rng.normal(size=chunk)
+    det = CrossingDetector(1e6, 2.5, 1.0)
+    tic = time.perf_counter()
+    for _ in range(samples//chunk):
+        det.update(block)
+    seconds = time.perf_counter() - tic
+    s = det.stats()
+    print('%.1e samples in %.1f s, %.0f Msamples/s; %d periods of '
+          '%.6f ms +- %.1e' % (det.n, seconds, det.n/seconds/1e6, s.count,
+                               1e3*s.mean, 1e3*s.std))
+    np.testing.assert_allclose(s.mean, period/1e6, rtol=1e-9)
@@ -0,0 +1,250 @@
+""" Binary cache of the text measurement files in book/data
+
+np.loadtxt parses the whole text file on every run. load() converts a
+whitespace/tab separated file, with or without a header row such as
+"n	T", once into a .npy file in a .npycache folder next to the source
+(one per dtype, e.g. thermocouples.dat.float64.npy),
+and afterwards opens it with np.memmap: no parsing and no copy, the
+operating system pages in only the parts of the record that are used.
+
+    from data_store import load
+    data = load('../data/thermocouples.dat')
+    T = data[:, 1]
+    names = header('../data/thermocouples.dat')    # ['n', 'T']
+
+The cache is rebuilt when the size and modification time of the source
+change and its SHA-1 hash changes too (a fresh checkout only touches the
+time, the hash check keeps the cache).
+"""
+import hashlib
+import json
+import os
+import tempfile
+from itertools import chain, islice
+
+import numpy as np
+
+CACHE_DIR = '.npycache'
+
+
+def _is_number(token):
+    try:
+        float(token)
+    except ValueError:
+        return False
+    return True
+
+
+def _sha1(path, block=2**24):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for b in iter(lambda: f.read(block), b''):
+            h.update(b)
+    return h.hexdigest()
+
+
+def _cache_paths(path, dtype=np.float64):
+    """ cache folder, .npy and .json files of path, per dtype so that
+    loads with different dtypes do not evict each other """
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    name = '%s.%s' % (os.path.basename(path), np.dtype(dtype).name)
+    return (folder, os.path.join(folder, name + '.npy'),
+            os.path.join(folder, name + '.json'))
+
+
+def _temporary(folder, name, suffix):
+    """ a new file of this process only, next to its final place """
+    fd, tmp = tempfile.mkstemp(suffix=suffix, prefix=name + '.', dir=folder)
+    os.close(fd)
+    return tmp
+
+
+def _write_json(meta, info):
+    """ write the metadata atomically, readers see the old or the new """
+    folder, name = os.path.split(meta)
+    tmp = _temporary(folder, name, '.tmp')
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp, meta)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def convert(path, dtype=np.float64, chunk_lines=2**18):
+    """ parse a text file into its .npy cache in one pass, chunk by chunk
+
+    Safe when several processes convert the same file at once (e.g. the
+    kernels of execute_notebooks.py): each one writes its own temporary
+    files and the finished cache replaces the old one atomically
+    """
+    folder, npy, meta = _cache_paths(path, dtype)
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.basename(npy)
+    raw = _temporary(folder, name, '.raw')
+    tmp = _temporary(folder, name, '.tmp')
+    try:
+        names = _convert(path, dtype, chunk_lines, raw, tmp)
+        os.replace(tmp, npy)
+    finally:
+        for leftover in (raw, tmp):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    st = os.stat(path)
+    _write_json(meta, {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                       'sha1': _sha1(path), 'names': names,
+                       'dtype': np.dtype(dtype).str})
+    return npy
+
+
+def _convert(path, dtype, chunk_lines, raw, tmp):
+    """ parse path into the .npy file tmp, through the binary file raw """
+    names = None
+    rows = 0
+    shape = None
+    with open(path) as f, open(raw, 'wb') as out:
+        lines = (line for line in f if line.strip())
+        first = next(lines, None)
+        if first is not None:
+            tokens = first.split()
+            if all(map(_is_number, tokens)):
+                lines = chain([first], lines)
+            else:
+                names = tokens
+        while True:
+            block = list(islice(lines, chunk_lines))
+            if not block:
+                break
+            values = np.loadtxt(block, dtype=dtype, ndmin=2)
+            shape = values.shape[1:]
+            values.tofile(out)
+            rows += len(block)
+
+    # 1-D for single column files, like np.loadtxt
+    shape = (rows,) if shape in (None, (1,)) else (rows,) + shape
+    data = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype,
+                                     shape=shape)
+    if rows:
+        data[...] = np.memmap(raw, dtype=dtype, mode='r', shape=shape)
+    data.flush()
+    del data
+    return names
+
+
+def _cached(path, dtype):
+    """ path of a valid cache file or None """
+    _, npy, meta = _cache_paths(path, dtype)
+    try:
+        with open(meta) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(npy) or info['dtype'] != np.dtype(dtype).str:
+        return None
+    st = os.stat(path)
+    if st.st_size == info['size'] and st.st_mtime_ns == info['mtime_ns']:
+        return npy
+    if st.st_size == info['size'] and _sha1(path) == info['sha1']:
+        info['mtime_ns'] = st.st_mtime_ns
+        _write_json(meta, info)
+        return npy
+    return None
+
+
+def load(path, dtype=np.float64, mmap=True):
+    """ drop-in replacement of np.loadtxt(path) for numeric text files
+
+    Returns a read-only np.memmap backed array (or an in-memory copy with
+    mmap=False) with one column per field, 1-D for single column files
+    """
+    npy = _cached(path, dtype) or convert(path, dtype)
+    return np.load(npy, mmap_mode='r' if mmap else None)
+
+
+def header(path):
+    """ column names from the header row of the source, or None
+
+    Read from the metadata of a valid cache of any dtype, the file is only
+    converted (to float64) when there is none
+    """
+    folder, _, _ = _cache_paths(path)
+    prefix = os.path.basename(path) + '.'
+    found = os.listdir(folder) if os.path.isdir(folder) else []
+    dtypes = [f[len(prefix):-len('.json')] for f in sorted(found)
+              if f.startswith(prefix) and f.endswith('.json')]
+    for dtype in dtypes + ['float64']:
+        _, _, meta = _cache_paths(path, dtype)
+        if _cached(path, dtype) is not None:
+            break
+    else:
+        load(path)
+    with open(meta) as f:
+        return json.load(f)['names']
+
+
+def _column_sum(path):
+    return float(load(path)[:, 0].sum())
+
+
+if __name__ == '__main__':
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'data')
+    for name in ['data_for_FFT.txt', 'thermocouples.dat',
+                 'sizedistribution.dat', 'FFT_Example_data_with_window.txt']:
+        path = os.path.join(data_dir, name)
+        skip = 1 if name == 'thermocouples.dat' else 0
+        np.testing.assert_array_equal(load(path),
+                                      np.loadtxt(path, skiprows=skip))
+        print(name, load(path).shape, header(path))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'log.dat')
+        rng = np.random.default_rng(5)
+        np.savetxt(path, np.c_[np.arange(1e6), rng.normal(30, 1, 10**6)],
+                   fmt='%.6g', delimiter='\t', header='n\tT', comments='')
+
+        tic = time.perf_counter()
+        ref = np.loadtxt(path, skiprows=1)
+        t_loadtxt = time.perf_counter() - tic
+        tic = time.perf_counter()
+        load(path)
+        t_convert = time.perf_counter() - tic
+        tic = time.perf_counter()
+        data = load(path)
+        data[:, 1].mean()
+        t_load = time.perf_counter() - tic
+        np.testing.assert_array_equal(data, ref)
+        print('1e6 rows: loadtxt %.3f s, first load %.3f s, cached %.5f s'
+              % (t_loadtxt, t_convert, t_load))
+
+        # six processes converting the same cold file at once
+        path = os.path.join(tmp, 'cold.dat')
+        np.savetxt(path, np.c_[np.arange(3e5), np.ones(3*10**5)], fmt='%d')
+        with ProcessPoolExecutor(6) as pool:
+            sums = list(pool.map(_column_sum, [path]*6))
+        assert sums == [3e5*(3e5 - 1)/2]*6, sums
+        assert sorted(os.listdir(os.path.join(tmp, CACHE_DIR))) == [
+            'cold.dat.float64.json', 'cold.dat.float64.npy',
+            'log.dat.float64.json', 'log.dat.float64.npy']
+
+        # float32 and float64 caches live side by side, header() reads
+        # the names of either without converting
+        path = os.path.join(tmp, 'log.dat')
+        npy32 = _cache_paths(path, np.float32)[1]
+        npy64 = _cache_paths(path, np.float64)[1]
+        load(path, np.float32)
+        stamps = os.stat(npy32).st_mtime_ns, os.stat(npy64).st_mtime_ns
+        for _ in range(3):
+            assert header(path) == ['n', 'T']
+            assert load(path, np.float32).dtype == np.float32
+            assert load(path).dtype == np.float64
+        assert (os.stat(npy32).st_mtime_ns,
+                os.stat(npy64).st_mtime_ns) == stamps
+        os.remove(npy64)
+        os.remove(_cache_paths(path)[2])
+        assert header(path) == ['n', 'T'] and not os.path.exists(npy64)
@@ -0,0 +1,239 @@
+""" Closed form responses of first and second order measurement systems
+
+Instead of simulating every case with scipy.signal.lti(...).step(), the
+analytic solutions are evaluated with NumPy broadcasting, so the
+parameters may be arrays and a whole family of transducers is computed
+in one call, e.g. t of shape (n,) with wn[:, None] and zeta[:, None].
+
+First order system, K / (tau s + 1), dynamic_signals/first_order_time_response.ipynb:
+
+    step q_is       q_o = K q_is (1 - e^{-t/tau})
+    ramp A t        q_o = K A (t - tau (1 - e^{-t/tau}))
+    impulse A       q_o = K A/tau e^{-t/tau}
+    sine, w         M = 1/sqrt(1 + (w tau)^2),  phi = -atan(w tau)
+
+Second order system, K wn^2 / (s^2 + 2 zeta wn s + wn^2), step input q_is:
+
+    q_o/(K q_is) = 1 - e^{-zeta wn t} [cos(wd t) + zeta/sqrt(1-zeta^2) sin(wd t)]
+
+with wd = wn sqrt(1 - zeta^2), which is the same as the form with
+sin^{-1}(sqrt(1-zeta^2)) in 2nd_order_system_step_function_log_decrement.ipynb.
+The over-damped and the critically damped cases are included. The sine
+input gives M = 1/sqrt((1 - r^2)^2 + (2 zeta r)^2) with r = w/wn.
+
+For grids too large for memory, LazyResponse computes only the part that
+is indexed, or walks through the grid block by block:
+
+    grid = LazyResponse(second_order_step, t, wn=wn[:, None, None],
+                        zeta=zeta[None, :, None], K=K[None, None, :])
+    grid[10, 3]                     # one transducer, all of t
+    for index, y in grid.blocks(1000):
+        overshoot[index] = y.max(axis=-1)
+"""
+import numpy as np
+
+
+def _decay_terms(t, wn, zeta):
+    """ c = e^{-zeta x} cosh(s x) and d = e^{-zeta x} sinh(s x)/s with
+    x = wn t and s = sqrt(zeta^2 - 1), that is e^{-zeta x} cos(wd/wn x) and
+    e^{-zeta x} sin(wd/wn x)/(wd/wn) when under-damped, written so that
+    nothing overflows for t >= 0 """
+    x = wn*np.asarray(t, dtype=float)
+    zeta = np.asarray(zeta, dtype=float)
+    under = zeta < 1 - 1e-8
+    over = zeta > 1 + 1e-8
+
+    w = np.sqrt(np.where(under, 1 - zeta**2, 1.0))
+    e = np.exp(-zeta*x)
+    c = e*np.cos(w*x)
+    d = e*np.sin(w*x)/w
+    if np.all(under):
+        return c, d
+
+    # near critical damping sinh(s x)/s -> x
+    c = np.where(under, c, e)
+    d = np.where(under, d, x*e)
+    if np.any(over):
+        s = np.sqrt(np.where(over, zeta**2 - 1, 1.0))
+        a = np.exp((s - zeta)*x)
+        b = np.exp(-(s + zeta)*x)
+        c = np.where(over, 0.5*(a + b), c)
+        d = np.where(over, 0.5*(a - b)/s, d)
+    return c, d
+
+
+def first_order_step(t, tau=1.0, K=1.0, q_is=1.0):
+    """ step response q_o(t) of a first order system, t >= 0 """
+    return K*q_is*-np.expm1(-np.asarray(t, dtype=float)/tau)
+
+
+def first_order_ramp(t, tau=1.0, K=1.0, A=1.0):
+    """ response to the ramp input A t, t >= 0 """
+    t = np.asarray(t, dtype=float)
+    return K*A*(t + tau*np.expm1(-t/tau))
+
+
+def first_order_impulse(t, tau=1.0, K=1.0, A=1.0):
+    """ response to the impulse of strength A, t >= 0 """
+    return K*A/tau*np.exp(-np.asarray(t, dtype=float)/tau)
+
+
+def first_order_frequency(w, tau=1.0):
+    """ amplitude ratio M and phase phi [rad] for a sine of w [rad/s] """
+    wt = np.asarray(w, dtype=float)*tau
+    return 1./np.sqrt(1 + wt**2), -np.arctan(wt)
+
+
+def second_order_step(t, K=1.0, wn=1.0, zeta=0.5, q_is=1.0):
+    """ step response q_o(t) of a second order system, t >= 0 """
+    c, d = _decay_terms(t, wn, zeta)
+    return K*q_is*(1 - c - zeta*d)
+
+
+def second_order_ramp(t, K=1.0, wn=1.0, zeta=0.5, A=1.0):
+    """ response to the ramp input A t, t >= 0
+
+    the integral of the step response,
+    K A [t - 2 zeta/wn (1 - c) + (2 zeta^2 - 1)/wn d]
+    """
+    c, d = _decay_terms(t, wn, zeta)
+    return K*A*(np.asarray(t, dtype=float)
+                - (2*zeta*(1 - c) - (2*zeta**2 - 1)*d)/wn)
+
+
+def second_order_impulse(t, K=1.0, wn=1.0, zeta=0.5):
+    """ impulse response h(t), the time derivative of the unit step response
+
+    h = K wn e^{-zeta wn t} sin(wd t)/sqrt(1 - zeta^2) for zeta < 1
+    """
+    _, d = _decay_terms(t, wn, zeta)
+    return K*wn*d
+
+
+def second_order_frequency(w, wn=1.0, zeta=0.5):
+    """ amplitude ratio M and phase phi [rad] for a sine of w [rad/s] """
+    r = np.asarray(w, dtype=float)/wn
+    return (1./np.sqrt((1 - r**2)**2 + (2*zeta*r)**2),
+            -np.arctan2(2*zeta*r, 1 - r**2))
+
+
+def sine_response(t, w, M, phi, K=1.0, A=1.0):
+    """ steady state output K A M sin(w t + phi) for the input A sin(w t) """
+    return K*A*M*np.sin(w*np.asarray(t, dtype=float) + phi)
+
+
+class LazyResponse:
+    """ response of a grid of parameters, computed where it is indexed
+
+    func is one of the responses above, called as func(t, **params). The
+    parameters broadcast to the grid shape, the result has the shape
+    grid + t.shape, but nothing is evaluated before indexing
+    """
+
+    def __init__(self, func, t, **params):
+        self.func = func
+        self.t = np.asarray(t, dtype=float)
+        self.params = {k: np.asarray(v, dtype=float)
+                       for k, v in params.items()}
+        self.grid_shape = np.broadcast_shapes(
+            *[v.shape for v in self.params.values()])
+        self.shape = self.grid_shape + self.t.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _evaluate(self, grid_index, t):
+        params = {}
+        for k, v in self.params.items():
+            v = np.broadcast_to(v, self.grid_shape)[grid_index]
+            params[k] = v[..., None] if t.ndim else v
+        return self.func(t, **params)
+
+    def __getitem__(self, index):
+        """ an index of the grid, optionally followed by one of t """
+        if not isinstance(index, tuple):
+            index = (index,)
+        n = len(self.grid_shape)
+        grid_index = index[:n] + (slice(None),)*(n - len(index[:n]))
+        t = self.t[index[n]] if len(index) > n else self.t
+        return self._evaluate(grid_index, t)
+
+    def blocks(self, size=1024):
+        """ (index, values) of the flattened grid, `size` cases at a time
+
+        index is a tuple of index arrays of the grid, values have the shape
+        (cases, len(t))
+        """
+        count = int(np.prod(self.grid_shape))
+        for start in range(0, count, size):
+            index = np.unravel_index(
+                np.arange(start, min(start + size, count)), self.grid_shape)
+            yield index, self._evaluate(index, self.t)
+
+
+if __name__ == '__main__':
+    import time
+    from scipy import signal
+
+    # first_order_time_response.ipynb
+    tau = 1.
+    t = np.arange(0, 10*tau, .0001)
+    np.testing.assert_allclose(first_order_step(t, tau), 1 - np.exp(-t/tau))
+    np.testing.assert_allclose(first_order_ramp(t, tau),
+                               t - tau*(1 - np.exp(-t/tau)), atol=1e-12)
+    np.testing.assert_allclose(first_order_impulse(t, tau),
+                               np.exp(-t/tau)/tau)
+
+    # step_function_demo.py
+    k, wn, z = 1, 546.72, 0.467
+    tic = time.perf_counter()
+    t, y_lti = signal.lti(k*wn**2, [1, 2*z*wn, wn**2]).step(N=1000)
+    t_lti = time.perf_counter() - tic
+    np.testing.assert_allclose(second_order_step(t, k, wn, z), y_lti,
+                               atol=1e-9)
+    for zeta in (0.0, 0.2, 1.0, 1.0 + 1e-10, 3.0):
+        sys = signal.lti(wn**2, [1, 2*zeta*wn, wn**2])
+        t, y_lti = sys.step(N=500)
+        np.testing.assert_allclose(second_order_step(t, 1, wn, zeta), y_lti,
+                                   atol=1e-7)
+        _, y_lti, _ = signal.lsim(sys, t, t)
+        np.testing.assert_allclose(second_order_ramp(t, 1, wn, zeta), y_lti,
+                                   atol=1e-7*t[-1])
+        w, mag, phase = signal.bode(sys, n=200)
+        M, phi = second_order_frequency(w, wn, zeta)
+        np.testing.assert_allclose(20*np.log10(M), mag, atol=1e-8)
+        np.testing.assert_allclose(np.degrees(phi), phase, atol=1e-8)
+    sys = signal.lti(1, [0.01, 1])
+    w, mag, phase = signal.bode(sys, n=200)
+    M, phi = first_order_frequency(w, 0.01)
+    np.testing.assert_allclose(20*np.log10(M), mag, atol=1e-8)
+
+    # a design sweep: 1000 damping ratios, one lti.step each or one array
+    zeta = np.linspace(0.05, 2.0, 1000)
+    tic = time.perf_counter()
+    y = second_order_step(t, 1.0, wn, zeta[:, None])
+    print('1000 step responses: %.4f s, one lti.step: %.4f s (x1000 = %.1f s)'
+          % (time.perf_counter() - tic, t_lti, 1000*t_lti))
+
+    # the impulse response is the derivative of the step response
+    np.testing.assert_allclose(
+        second_order_impulse(t[1:-1], 1.0, wn, 0.3),
+        np.gradient(second_order_step(t, 1.0, wn, 0.3), t)[1:-1],
+        rtol=1e-3, atol=1e-3*wn)
+
+    # 200 x 1000 transducers x 500 samples = 800 MB if computed at once
+    wns = np.linspace(200, 2000, 200)[:, None]
+    grid = LazyResponse(second_order_step, t, wn=wns, zeta=zeta[None, :])
+    np.testing.assert_allclose(grid[0, 3], second_order_step(t, 1, 200,
+                                                             zeta[3]))
+    np.testing.assert_allclose(grid[5, :, -1], second_order_step(
+        t[-1], 1, wns[5], zeta))
+    overshoot = np.empty(grid.grid_shape)
+    tic = time.perf_counter()
+    for index, y in grid.blocks(10000):
+        overshoot[index] = y.max(axis=-1) - 1
+    print('%s grid, largest overshoot in %.2f s'
+          % (grid.shape, time.perf_counter() - tic))
+    M = np.exp(-np.pi*zeta/np.sqrt(1 - zeta**2 + 0j)).real*(zeta < 1)
+    print('max |overshoot - exp(-pi zeta/sqrt(1-zeta^2))| at wn = 2000: '
+          '%.1e' % np.max(np.abs(overshoot[-1] - M)))
@@ -0,0 +1,261 @@
+""" Execute the notebooks of the book in parallel, with a cache of outputs
+
+The build runs every notebook one after the other, also the ones that did
+not change, and some of them simulate 10^6 samples. This executor
+
+- runs the notebooks in a process pool, every notebook in its own worker
+  process and kernel
+- skips a notebook when the hash of its cells (without outputs), of the
+  data files it reads (string literals, or os.path.join of literals, that
+  name existing files) and of
+  the local modules it imports (book/scripts/*.py, ...), followed through
+  the imports and data files of those modules, is unchanged:
+  the executed notebook is kept in the cache under that hash
+- reports the wall time and the peak memory (resident set of the kernel)
+  of every notebook, the slowest first
+
+    python book/scripts/execute_notebooks.py book -j 8
+    python book/scripts/execute_notebooks.py book/statistics --inplace
+
+With --inplace the executed outputs are written back into the notebooks,
+so that the site can be built without execution. Requires nbformat and
+nbclient, which come with jupyter-book.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+CACHE_DIR = '.nbcache'
+SKIP = ('.ipynb_checkpoints', '_build', 'archive')
+
+_STRING = re.compile(r'''(['"])([^'"\n]+?)\1''')
+# arguments of os.path.join, with up to two levels of nested calls
+_JOIN = re.compile(r'os\.path\.join\('
+                   r'((?:[^()]|\((?:[^()]|\([^()]*\))*\))*)\)')
+_IMPORT = re.compile(r'^\s*(?:from|import)\s+([A-Za-z_]\w*)', re.M)
+
+
+def find_notebooks(paths, skip=SKIP):
+    """ all the .ipynb files under the paths, without the skipped folders """
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in skip)
+            found += [os.path.join(root, f) for f in sorted(files)
+                      if f.endswith('.ipynb')]
+    return found
+
+
+def _file_digest(path, digests={}):
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in digests:
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        digests[key] = sha.hexdigest()
+    return digests[key]
+
+
+def dependencies(path, source, module_dirs=()):
+    """ data files and local modules named in the code of a notebook, and
+    in turn in the code of those modules """
+    found, visited = set(), set()
+    todo = [(os.path.dirname(os.path.abspath(path)), source)]
+    while todo:
+        folder, code = todo.pop()
+        names = [name for _, name in _STRING.findall(code)]
+        # os.path.join(here, '..', 'data', 'file.dat') of the scripts
+        names += [os.path.join(*parts) for parts in (
+            [p for _, p in _STRING.findall(args)]
+            for args in _JOIN.findall(code)) if parts]
+        for name in names:
+            candidate = os.path.normpath(os.path.join(folder, name))
+            if os.path.isfile(candidate):
+                found.add(candidate)
+        for module in _IMPORT.findall(code):
+            for d in (folder,) + tuple(module_dirs):
+                candidate = os.path.abspath(os.path.join(d, module + '.py'))
+                if os.path.isfile(candidate):
+                    found.add(candidate)
+                    if candidate not in visited:
+                        visited.add(candidate)
+                        with open(candidate, encoding='utf-8') as f:
+                            todo.append((os.path.dirname(candidate),
+                                         f.read()))
+                    break
+    return sorted(found)
+
+
+def _source(cell):
+    source = cell.get('source', '')
+    return ''.join(source) if isinstance(source, list) else source
+
+
+def notebook_key(path, module_dirs=(), kernel=None):
+    """ hash of all the cells without their outputs, the kernel and the
+    dependencies
+
+    Markdown cells are part of the key, so that --inplace never puts back
+    a cached copy with older text. Outputs, execution counts and the
+    timing metadata that the execution itself writes are left out, so an
+    executed notebook keeps the key of its source.
+    """
+    with open(path, encoding='utf-8') as f:
+        nb = json.load(f)
+    cells = [{'cell_type': c.get('cell_type'), 'source': _source(c),
+              'metadata': {k: v for k, v in c.get('metadata', {}).items()
+                           if k not in ('execution', 'collapsed', 'scrolled')}}
+             for c in nb.get('cells', [])]
+    source = '\n'.join(_source(c) for c in nb.get('cells', [])
+                       if c.get('cell_type') == 'code')
+    kernel = kernel or nb.get('metadata', {}).get(
+        'kernelspec', {}).get('name', '')
+    sha = hashlib.sha1()
+    sha.update(json.dumps(cells, sort_keys=True).encode())
+    sha.update(kernel.encode())
+    for dep in dependencies(path, source, module_dirs):
+        sha.update(dep.encode())
+        sha.update(_file_digest(dep).encode())
+    return sha.hexdigest()
+
+
+def _peak_rss():
+    """ largest resident set [MB] of this process and its reaped children
+    (the kernel) """
+    scale = 1. if sys.platform == 'darwin' else 1024.
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak*scale/2**20
+
+
+def _execute(job):
+    """ run one notebook, in a worker process of its own """
+    import nbformat
+    from nbclient import NotebookClient
+
+    path, target, timeout, kernel = job
+    tic = time.perf_counter()
+    try:
+        nb = nbformat.read(path, as_version=4)
+        client = NotebookClient(
+            nb, timeout=timeout, kernel_name=kernel or '',
+            resources={'metadata': {'path': os.path.dirname(path) or '.'}})
+        client.execute()
+        nbformat.write(nb, target + '.tmp')
+        os.replace(target + '.tmp', target)
+        status, error = 'ok', ''
+    except Exception as e:      # failing cells are reported, not raised
+        status, error = 'error', str(e).strip().splitlines()[-1:] or ['']
+        error = error[0]
+    return path, status, error, time.perf_counter() - tic, _peak_rss()
+
+
+def execute(paths, workers=None, cache_dir=CACHE_DIR, timeout=600,
+            kernel=None, inplace=False, force=False, module_dirs=()):
+    """ execute the notebooks that changed, see the module help
+
+    Returns:
+        list of dict(path, status, seconds, peak_mb, key), status is
+        'cached', 'ok' or 'error'
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    report_path = os.path.join(cache_dir, 'report.json')
+    previous = {}
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            previous = {r['path']: r for r in json.load(f)}
+
+    records, jobs = {}, []
+    for path in paths:
+        key = notebook_key(path, module_dirs, kernel)
+        target = os.path.join(cache_dir, key + '.ipynb')
+        if os.path.exists(target) and not force:
+            last = previous.get(path, {})
+            records[path] = dict(path=path, status='cached', key=key,
+                                 seconds=last.get('seconds', 0.0),
+                                 peak_mb=last.get('peak_mb', 0.0))
+        else:
+            records[path] = dict(path=path, key=key)
+            jobs.append((path, target, timeout, kernel))
+
+    # the longest notebooks of the last run go first
+    jobs.sort(key=lambda j: -previous.get(j[0], {}).get('seconds', 0.0))
+    if jobs:
+        import nbclient  # noqa: F401, fail here rather than in every worker
+        try:
+            # a fresh worker per notebook, so that ru_maxrss is its own
+            pool = ProcessPoolExecutor(workers, max_tasks_per_child=1)
+        except TypeError:           # Python < 3.11, peaks are cumulative
+            pool = ProcessPoolExecutor(workers)
+        with pool:
+            for path, status, error, seconds, peak in pool.map(_execute,
+                                                               jobs):
+                records[path].update(status=status, error=error,
+                                     seconds=seconds, peak_mb=peak)
+                if status == 'error':
+                    print('%s: %s' % (path, error), file=sys.stderr)
+
+    report = [records[p] for p in paths]
+    for r in report:
+        if inplace and r['status'] != 'error':
+            cached = os.path.join(cache_dir, r['key'] + '.ipynb')
+            shutil.copyfile(cached, r['path'])
+    # keep the timings of the notebooks that were not part of this run
+    previous.update((r['path'], r) for r in report if r['status'] != 'error')
+    with open(report_path, 'w') as f:
+        json.dump(list(previous.values()), f, indent=1)
+    return report
+
+
+def print_report(report):
+    print('%8s %9s %7s  %s' % ('seconds', 'peak MB', 'status', 'notebook'))
+    for r in sorted(report, key=lambda r: -r.get('seconds', 0.0)):
+        print('%8.1f %9.0f %7s  %s' % (r.get('seconds', 0.0),
+                                       r.get('peak_mb', 0.0), r['status'],
+                                       r['path']))
+    run = [r for r in report if r['status'] != 'cached']
+    print('%d notebooks, %d executed, %d cached, %d failed, %.1f s of '
+          'kernel time' % (len(report), len(run), len(report) - len(run),
+                           sum(r['status'] == 'error' for r in report),
+                           sum(r.get('seconds', 0.0) for r in run)))
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='*',
+                        default=[os.path.dirname(here)],
+                        help='notebooks or folders, the book by default')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='parallel kernels, all the cores by default')
+    parser.add_argument('--timeout', type=int, default=600,
+                        help='per cell [s]')
+    parser.add_argument('--kernel', default=None)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--inplace', action='store_true',
+                        help='write the outputs into the notebooks')
+    parser.add_argument('--force', action='store_true',
+                        help='execute also the unchanged notebooks')
+    args = parser.parse_args(argv)
+
+    report = execute(find_notebooks(args.paths), args.workers,
+                     args.cache_dir, args.timeout, args.kernel,
+                     args.inplace, args.force, module_dirs=[here])
+    print_report(report)
+    return int(any(r['status'] == 'error' for r in report))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
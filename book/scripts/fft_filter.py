@@ -0,0 +1,165 @@
+""" Streaming FFT-domain Butterworth filter (overlap-add)
+
+signal_processing/FFT_based_filtering.ipynb multiplies the FFT of the whole
+record by the Butterworth gain
+
+    G(f) = 1/sqrt(1 + (f/f_cut)^(2n))
+
+and transforms back. Here the same magnitude response is applied block by
+block to a live stream: G is sampled into a linear phase FIR kernel of
+`taps` coefficients (tapered by a Hann window), its rfft is computed once
+per (block size, fs, f_cut, order, taps) and every incoming block is
+filtered with one rfft/irfft pair, the tails of the blocks overlap and
+are added to the next output. The output of every chunk is available as
+soon as the chunk arrives, delayed by (taps - 1)/2 samples.
+
+The kernel has to span the impulse response of the filter, which lasts
+longer for a lower f_cut/fs and a higher order: by default it holds
+4 (order + 1) periods of f_cut, and the realized |H| is checked against G
+on the FFT grid, a kernel that misses it by more than `tolerance` raises
+a ValueError.
+
+    flt = OverlapAddFilter(fs, f_cut=500, order=10)
+    for chunk in acquisition:
+        y = flt.process(chunk)
+"""
+from functools import lru_cache
+
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft
+
+
+def butterworth_gain(f, f_cut, order):
+    """ magnitude of the Butterworth low-pass filter of order n """
+    return 1./np.sqrt(1 + (np.abs(f)/f_cut)**(2*order))
+
+
+def default_taps(fs, f_cut, order):
+    """ odd number of taps that spans 4 (order + 1) periods of f_cut """
+    return int(np.ceil(4*(order + 1)*fs/f_cut)) | 1
+
+
+@lru_cache(maxsize=64)
+def filter_spectrum(block_size, fs, f_cut, order, taps, tolerance=0.01):
+    """ FFT length and the rfft of the FIR kernel, cached per parameters
+
+    Raises ValueError when max | |H| - G | exceeds tolerance
+    """
+    if taps % 2 == 0:
+        raise ValueError('taps must be odd for an integer delay')
+    # zero phase impulse response of G sampled on `taps` frequencies,
+    # shifted to the middle and tapered
+    f = np.fft.rfftfreq(taps, 1./fs)
+    h = np.fft.irfft(butterworth_gain(f, f_cut, order), taps)
+    h = np.roll(h, taps//2)*np.hanning(taps + 2)[1:-1]
+    nfft = next_fast_len(block_size + taps - 1, real=True)
+    H = rfft(h, nfft)
+    error = np.max(np.abs(np.abs(H) - butterworth_gain(
+        np.fft.rfftfreq(nfft, 1./fs), f_cut, order)))
+    if error > tolerance:
+        raise ValueError('%d taps miss the Butterworth gain by %.3f, %d '
+                         'taps are needed' % (taps, error,
+                                              default_taps(fs, f_cut, order)))
+    H.flags.writeable = False
+    return nfft, H
+
+
+class OverlapAddFilter:
+    """ stateful low-pass filter of a stream of chunks of any length
+
+    taps : length of the FIR kernel, default_taps() by default
+    tolerance : largest error of the realized |H| against G
+    """
+
+    def __init__(self, fs, f_cut, order, block_size=4096, taps=None,
+                 tolerance=0.01):
+        if taps is None:
+            taps = default_taps(fs, f_cut, order)
+        self.block_size = block_size
+        self.taps = taps
+        self.delay = (taps - 1)//2
+        self.nfft, self.H = filter_spectrum(block_size, float(fs),
+                                            float(f_cut), order, taps,
+                                            tolerance)
+        self._tail = np.zeros(taps - 1)
+
+    def process(self, chunk):
+        """ filtered samples of the chunk, same length as the chunk """
+        chunk = np.asarray(chunk, dtype=float)
+        out = np.empty_like(chunk)
+        for start in range(0, chunk.size, self.block_size):
+            x = chunk[start:start + self.block_size]
+            n = x.size
+            y = irfft(rfft(x, self.nfft)*self.H, self.nfft)[:n + self.taps - 1]
+            y[:self.taps - 1] += self._tail
+            out[start:start + n] = y[:n]
+            self._tail = y[n:]
+        return out
+
+    def flush(self):
+        """ the last taps - 1 samples still in the overlap """
+        tail, self._tail = self._tail, np.zeros(self.taps - 1)
+        return tail
+
+
+def filter_record(x, fs, f_cut, order, chunk_size=2**16, **kwargs):
+    """ filter a whole record (array or np.memmap) chunk by chunk
+
+    The delay of the kernel is removed, the output is aligned with x
+    """
+    flt = OverlapAddFilter(fs, f_cut, order, **kwargs)
+    pieces = [flt.process(x[i:i + chunk_size])
+              for i in range(0, len(x), chunk_size)]
+    y = np.concatenate(pieces + [flt.flush()])
+    return y[flt.delay:flt.delay + len(x)]
+
+
+if __name__ == '__main__':
+    import os
+    import time
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'data', 'data_for_FFT_filter.txt')
+    data = np.loadtxt(path)
+    t, f = data[:, 0], data[:, 1]
+    fs = 1./(t[1] - t[0])
+    f_cut, order_n = 500., 10
+
+    # the notebook: gain on the two sided frequencies of the full record
+    frequency = np.abs(np.fft.fftfreq(f.size, 1./fs))
+    reference = np.real(np.fft.ifft(np.fft.fft(f)*butterworth_gain(
+        frequency, f_cut, order_n)))
+
+    y = filter_record(f, fs, f_cut, order_n)
+    inner = slice(40, -40)  # the reference is circular at the ends
+    print('max |streaming - full FFT| = %.3f V of %.3f V'
+          % (np.max(np.abs(y - reference)[inner]), np.ptp(f)))
+
+    # any chunking gives the same stream
+    flt = OverlapAddFilter(fs, f_cut, order_n, block_size=64)
+    rng = np.random.default_rng(7)
+    cuts = np.sort(rng.choice(f.size, 10, replace=False))
+    y_live = np.concatenate([flt.process(c) for c in np.split(f, cuts)]
+                            + [flt.flush()])
+    np.testing.assert_allclose(y_live[flt.delay:flt.delay + f.size], y,
+                               atol=1e-12)
+
+    # a low cut-off needs a long kernel, a short one is refused
+    for fs, f_cut, order_n in ((1e4, 50., 10), (1e4, 20., 4)):
+        flt = OverlapAddFilter(fs, f_cut, order_n)
+        G = butterworth_gain(np.fft.rfftfreq(flt.nfft, 1/fs), f_cut, order_n)
+        np.testing.assert_allclose(np.abs(flt.H), G, atol=0.01)
+        print('fs = %g Hz, f_cut = %g Hz, n = %d: %d taps, |H(2 f_cut)| = '
+              '%.1e' % (fs, f_cut, order_n, flt.taps, np.abs(flt.H)[np.argmin(
+                  np.abs(np.fft.rfftfreq(flt.nfft, 1/fs) - 2*f_cut))]))
+    try:
+        OverlapAddFilter(1e4, 50., 10, taps=257)
+    except ValueError as e:
+        print(e)
+    else:
+        raise AssertionError('257 taps accepted for f_cut = 50 Hz')
+
+    x = rng.normal(0, 1, 10**7)
+    tic = time.perf_counter()
+    filter_record(x, 10000., 500., 10)
+    print('1e7 samples filtered in %.2f s' % (time.perf_counter() - tic))
@@ -0,0 +1,172 @@
+""" Fourier series coefficients of periodic waveforms for any number of
+harmonics
+
+dynamic_signals/symbolic_evaluation_Fourier_coefficients.ipynb integrates
+f sin(n pi t) and f cos(n pi t) with sympy once for every n in a loop and
+substitutes pi = 3.14. Here the integrals are evaluated once for a general
+integer n > 0 and turned into a NumPy function of n, so thousands of
+harmonics cost one array expression:
+
+    import sympy as sp
+    from fourier_series import fourier_series
+    t, T, G = sp.symbols('t T G', positive=True)
+    fs = fourier_series(G*t, t, T, symbols=[G, T])     # the notebook ramp
+    a0, a, b = fs.coefficients(5000, G=25, T=1)
+    y = fs(tt, 5000, G=25, T=1)                        # partial sum
+
+with f(t) = a0/2 + sum_n a_n cos(2 pi n t/T) + b_n sin(2 pi n t/T) over
+one period [start, start + T]. When sympy cannot integrate the waveform,
+the coefficients are computed numerically from the FFT of the waveform
+sampled on the period, and fft_coefficients() does the same for any
+sampled period. The compiled series are kept per waveform expression.
+"""
+import hashlib
+
+import numpy as np
+import sympy as sp
+from scipy import fft
+
+_compiled = {}
+
+
+def fft_coefficients(y, n_max):
+    """ a0, a_n, b_n (n = 1..n_max) of one period sampled uniformly,
+    y[k] = f(start + k T/N), N > 2 n_max """
+    y = np.asarray(y, dtype=float)
+    N = y.shape[-1]
+    if N <= 2*n_max:
+        raise ValueError('at least 2 n_max + 1 samples per period')
+    Y = fft.rfft(y, axis=-1)*(2./N)
+    return Y[..., 0].real, Y[..., 1:n_max + 1].real, -Y[..., 1:n_max + 1].imag
+
+
+class FourierSeries:
+    """ compiled Fourier series of one waveform, see fourier_series() """
+
+    def __init__(self, expression, t, T, start, symbols, symbolic=True):
+        self.expression = expression
+        self.names = [str(s) for s in symbols]
+        self.T, self.start = T, start
+        n = sp.Symbol('n', integer=True, positive=True)
+        w = 2*sp.pi*n/T
+        period = (t, start, start + T)
+        if symbolic:
+            a0 = 2/T*sp.integrate(expression, period)
+            a = 2/T*sp.integrate(expression*sp.cos(w*t), period)
+            b = 2/T*sp.integrate(expression*sp.sin(w*t), period)
+            symbolic = not any(c.has(sp.Integral) for c in (a0, a, b))
+        self.symbolic = symbolic
+        if symbolic:
+            self.a0, self.a, self.b = [sp.simplify(c) for c in (a0, a, b)]
+            self._coefficients = sp.lambdify(
+                [n] + list(symbols), [self.a0, self.a, self.b], 'numpy')
+        self._waveform = sp.lambdify([t] + list(symbols), expression,
+                                     'numpy')
+        self._period = sp.lambdify(list(symbols), [T, start], 'numpy')
+
+    def _values(self, values):
+        return [values[name] for name in self.names]
+
+    def coefficients(self, n_max, **values):
+        """ a0 and the arrays a_n, b_n for n = 1..n_max """
+        args = self._values(values)
+        if not self.symbolic:
+            return self.numeric(n_max, **values)
+        n = np.arange(1, n_max + 1)
+        a0, a, b = self._coefficients(n, *args)
+        a0 = np.asarray(a0, dtype=float)
+        return (a0, np.broadcast_to(a, n.shape).astype(float),
+                np.broadcast_to(b, n.shape).astype(float))
+
+    def numeric(self, n_max, samples=None, **values):
+        """ the coefficients from the FFT of the sampled waveform """
+        args = self._values(values)
+        T, start = [float(v) for v in self._period(*args)]
+        N = samples or fft.next_fast_len(64*n_max + 1)
+        t = start + T*np.arange(N)/N
+        y = np.broadcast_to(self._waveform(t, *args), t.shape)
+        return fft_coefficients(y, n_max)
+
+    def __call__(self, t, n_max, **values):
+        """ partial sum of n_max harmonics at the times t """
+        a0, a, b = self.coefficients(n_max, **values)
+        T = float(self._period(*self._values(values))[0])
+        t = np.asarray(t, dtype=float)
+        y = np.full(t.shape, a0/2)
+        # in chunks of harmonics to bound the (t, n) temporary array
+        for i in range(0, n_max, 256):
+            n = np.arange(i + 1, min(i + 256, n_max) + 1)
+            wt = np.multiply.outer(t, 2*np.pi*n/T)
+            y += np.cos(wt) @ a[i:i + 256] + np.sin(wt) @ b[i:i + 256]
+        return y
+
+
+def fourier_series(expression, t, T, start=0, symbols=(), symbolic=True):
+    """ compile the Fourier series of expression(t) with period T
+
+    Inputs:
+        expression : sympy expression of one period of the waveform, may be
+            a Piecewise
+        t : the time symbol
+        T : period, a number or one of the symbols
+        start : the period is [start, start + T]
+        symbols : the parameters (G, T, ...) given as keywords later
+        symbolic : False skips sympy.integrate, which can take very long
+            for waveforms without a closed form, and uses the FFT
+
+    Returns:
+        FourierSeries, the same object for the same waveform
+    """
+    symbols = list(symbols)
+    text = '|'.join(sp.srepr(sp.sympify(e))
+                    for e in [expression, t, T, start] + symbols)
+    text += '|%s' % symbolic
+    key = hashlib.sha1(text.encode()).hexdigest()
+    if key not in _compiled:
+        _compiled[key] = FourierSeries(expression, t, sp.sympify(T),
+                                       sp.sympify(start), symbols, symbolic)
+    return _compiled[key]
+
+
+if __name__ == '__main__':
+    import time
+    from scipy import integrate
+
+    t, T, G = sp.symbols('t T G', positive=True)
+
+    # the notebook, one integral per harmonic
+    tic = time.perf_counter()
+    for k in range(1, 10):
+        (2/T*sp.integrate(G*t*sp.cos(2*k*sp.pi*t/T), (t, 0, T)),
+         2/T*sp.integrate(G*t*sp.sin(2*k*sp.pi*t/T), (t, 0, T)))
+    t_loop = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    ramp = fourier_series(G*t, t, T, symbols=[G, T])
+    t_compile = time.perf_counter() - tic
+    tic = time.perf_counter()
+    a0, a, b = ramp.coefficients(5000, G=25, T=1)
+    print('9 harmonics in a loop %.2f s; general n %.2f s, then 5000 '
+          'harmonics in %.1e s' % (t_loop, t_compile,
+                                   time.perf_counter() - tic))
+    print('a0/2 = %s, b_n = %s' % (ramp.a0/2, ramp.b))
+    n = np.arange(1, 5001)
+    np.testing.assert_allclose(b, -25/(np.pi*n))
+    np.testing.assert_allclose(a, 0, atol=1e-12)
+    assert fourier_series(G*t, t, T, symbols=[G, T]) is ramp
+
+    # the numerical coefficients of the same ramp converge to the exact ones
+    a0_fft, a_fft, b_fft = ramp.numeric(50, G=25, T=1)
+    print('FFT of the sampled ramp, max error of b_n, n <= 50: %.1e'
+          % np.max(np.abs(b_fft - b[:50])))
+
+    # a square wave as a Piecewise, and a waveform without a closed form
+    square = fourier_series(sp.Piecewise((1, t < sp.pi), (-1, True)),
+                            t, 2*sp.pi)
+    a0, a, b = square.coefficients(7)
+    np.testing.assert_allclose(b, [4/np.pi/k if k % 2 else 0
+                                   for k in range(1, 8)], atol=1e-12)
+    bump = fourier_series(sp.exp(sp.sin(t)**3), t, 2*sp.pi, symbolic=False)
+    a0, a, b = bump.coefficients(10)
+    np.testing.assert_allclose(a0, integrate.quad(
+        lambda x: np.exp(np.sin(x)**3), 0, 2*np.pi)[0]/np.pi)
@@ -0,0 +1,198 @@
+""" Chi-square test of normality for many sets of repeated measurements
+
+statistics/chi_square_test_example.ipynb tests one 20 point pressure set:
+histogram, fitted normal distribution, sum of (observed - expected)^2 /
+expected and 1 - chi2.cdf(chi^2, dof), with the degrees of freedom counted
+by hand. Here every row of an (n_sets, n_samples) array is tested at once:
+
+    from goodness_of_fit import chi_square_normal
+    r = chi_square_normal(P)          # P of shape (channels, readings)
+    r.chi2, r.dof, r.pvalue
+
+1. mean and standard deviation of every set (or the given loc, scale)
+2. observed counts of all the sets in one bincount, on per-set equal bins
+   between the smallest and largest reading or on shared edges
+3. expected counts N (Phi(b_j+1) - Phi(b_j)), the outer bins are open to
+   -inf and +inf so that they add up to N
+4. adjacent bins are merged from left to right until every group expects
+   at least min_expected readings, the remainder joins the last group;
+   then  dof = groups - 1 - (number of estimated parameters)
+
+Rows may be padded with NaN for sets of unequal length.
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy import special, stats
+
+from stat_tables import chi2_ppf
+
+ChiSquareResult = namedtuple('ChiSquareResult',
+                             ['chi2', 'dof', 'pvalue', 'critical', 'groups',
+                              'loc', 'scale', 'N'])
+ChiSquareResult.__doc__ = """ per set chi^2, degrees of freedom, p-value
+P(X > chi^2), critical chi^2 at the level, number of (merged) bins used,
+the normal distribution tested and the number of readings """
+
+
+def bin_count(N):
+    """ K = 1.87 (N - 1)^0.4 + 1 of full_calibration_analysis_example """
+    return np.maximum(np.ceil(1.87*(np.asarray(N) - 1)**0.4 + 1),
+                      5).astype(int)
+
+
+def _bin_index(x, edges):
+    """ bin of every sample, edges (bins+1,) shared or (sets, bins+1) """
+    if edges.ndim == 1:
+        j = np.searchsorted(edges, x, side='right') - 1
+    else:
+        j = np.zeros(x.shape, dtype=int)
+        for e in edges[:, 1:-1].T:
+            j += x >= e[:, None]
+    return np.clip(j, 0, edges.shape[-1] - 2)
+
+
+def _merge_groups(observed, expected, min_expected):
+    """ chi^2 and number of groups after merging bins left to right """
+    sets, bins = expected.shape
+    acc_o, acc_e = np.zeros(sets), np.zeros(sets)
+    last_o, last_e = np.zeros(sets), np.zeros(sets)
+    chi2, groups = np.zeros(sets), np.zeros(sets, dtype=int)
+    for j in range(bins):
+        acc_o += observed[:, j]
+        acc_e += expected[:, j]
+        close = acc_e >= min_expected
+        # the previous group is final once the next one is complete
+        done = close & (groups > 0)
+        chi2[done] += (last_o[done] - last_e[done])**2/last_e[done]
+        last_o[close], last_e[close] = acc_o[close], acc_e[close]
+        acc_o[close], acc_e[close] = 0, 0
+        groups += close
+    last_o += acc_o
+    last_e += acc_e
+    with np.errstate(invalid='ignore', divide='ignore'):
+        chi2 += np.where(last_e > 0, (last_o - last_e)**2/last_e, 0.0)
+    return chi2, np.maximum(groups, 1)
+
+
+def chi_square_normal(x, bins=None, loc=None, scale=None, min_expected=5.0,
+                      ddof=None, level=0.95):
+    """ chi^2 goodness of fit of a normal distribution for every row of x
+
+    Inputs:
+        x : (n_sets, n_samples) readings, NaN padded, or one set (n,)
+        bins : None (bin_count of the N of every set), the number of
+            equal bins per set, or edges, (bins+1,) shared by all sets or
+            (n_sets, bins+1)
+        loc, scale : the tested distribution, per set; estimated from the
+            data (mean and standard deviation, ddof=1) when None
+        min_expected : smallest expected count of a group of bins
+        ddof : number of estimated parameters, by default 2 when loc and
+            scale are estimated and 0 when they are given
+        level : for the critical chi^2
+
+    Returns:
+        ChiSquareResult of arrays (n_sets,), p-values of sets with dof < 1
+        are NaN
+    """
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    sets = x.shape[0]
+    valid = np.isfinite(x)
+    N = valid.sum(axis=1)
+    if ddof is None:
+        ddof = 2 if loc is None and scale is None else 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if loc is None:
+            loc = np.nanmean(x, axis=1)
+        if scale is None:
+            scale = np.nanstd(x, axis=1, ddof=1)
+    loc = np.broadcast_to(np.asarray(loc, dtype=float), (sets,))
+    scale = np.broadcast_to(np.asarray(scale, dtype=float), (sets,))
+
+    if bins is None or np.ndim(bins) == 0:
+        # k bins of every set, the edges beyond its last bin are +inf and
+        # leave empty bins that the merging skips
+        k = bin_count(np.maximum(N, 1)) if bins is None \
+            else np.full(sets, int(bins))
+        step = np.arange(k.max() + 1)
+        with np.errstate(invalid='ignore'):
+            lo, hi = np.nanmin(x, axis=1), np.nanmax(x, axis=1)
+        edges = lo[:, None] + (hi - lo)[:, None]*step/k[:, None]
+        edges[step >= k[:, None]] = np.inf
+    else:
+        edges = np.asarray(bins, dtype=float)
+    k = edges.shape[-1] - 1
+
+    j = _bin_index(np.where(valid, x, np.inf), edges)
+    rows = np.broadcast_to(np.arange(sets)[:, None], x.shape)
+    observed = np.bincount((rows*k + j)[valid],
+                           minlength=sets*k).reshape(sets, k)
+
+    # expected counts with open outer bins
+    inner = np.broadcast_to(edges[..., 1:-1], (sets, k - 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cdf = special.ndtr((inner - loc[:, None])/scale[:, None])
+    cdf = np.c_[np.zeros(sets), cdf, np.ones(sets)]
+    expected = N[:, None]*np.diff(cdf, axis=1)
+
+    chi2, groups = _merge_groups(observed, expected, min_expected)
+    dof = groups - 1 - ddof
+    ok = dof >= 1
+    pvalue = np.where(ok, stats.chi2.sf(chi2, np.maximum(dof, 1)), np.nan)
+    critical = np.where(ok, chi2_ppf(level, np.maximum(dof, 1)), np.nan)
+    return ChiSquareResult(chi2, dof, pvalue, critical, groups, loc, scale, N)
+
+
+if __name__ == '__main__':
+    import time
+
+    # the notebook set, 0.05 kPa bins
+    y = np.array([10.02, 10.20, 10.26, 10.20, 10.22, 10.13, 9.97, 10.12,
+                  10.09, 9.90, 10.05, 10.17, 10.42, 10.21, 10.23, 10.11,
+                  9.98, 10.10, 10.04, 9.81])
+    edges = np.arange(9.65, 10.55, 0.05)
+    r = chi_square_normal(y, edges, min_expected=1)
+    print('merged >= 1: chi^2 = %.3f, dof = %d, p = %.3f'
+          % (r.chi2[0], r.dof[0], r.pvalue[0]))
+    r = chi_square_normal(y, edges)
+    print('merged >= 5: chi^2 = %.3f, dof = %d, p = %.3f'
+          % (r.chi2[0], r.dof[0], r.pvalue[0]))
+
+    # a NaN padded set gets the bins of its own N
+    padded = chi_square_normal(np.vstack([np.r_[y, np.full(480, np.nan)],
+                                          np.linspace(9, 11, 500)]))
+    r = chi_square_normal(y)
+    np.testing.assert_allclose(padded.chi2[0], r.chi2[0])
+    assert padded.groups[0] == r.groups[0] and padded.N[0] == 20
+
+    # the same as scipy.stats.chisquare on the merged groups of one set
+    rng = np.random.default_rng(15)
+    x = rng.normal(10, 0.1, 200)
+    r = chi_square_normal(x, 12)
+    e = np.linspace(x.min(), x.max(), 13)
+    o = np.histogram(x, e)[0]
+    p = np.diff(np.r_[0, stats.norm.cdf(e[1:-1], x.mean(), x.std(ddof=1)), 1])
+    obs, exp, acc = [], [], [0, 0.0]
+    for oj, ej in zip(o, 200*p):
+        acc = [acc[0] + oj, acc[1] + ej]
+        if acc[1] >= 5:
+            obs.append(acc[0])
+            exp.append(acc[1])
+            acc = [0, 0.0]
+    obs[-1] += acc[0]
+    exp[-1] += acc[1]
+    ref = stats.chisquare(obs, exp, ddof=2)
+    np.testing.assert_allclose([r.chi2[0], r.pvalue[0]], [ref.statistic,
+                                                          ref.pvalue])
+
+    # 20000 channels of 500 readings, a tenth of them not normal
+    sets = 20000
+    P = rng.normal(10, 0.1, (sets, 500))
+    P[::10] = 10 + rng.uniform(-0.2, 0.2, (sets//10, 500))
+    tic = time.perf_counter()
+    r = chi_square_normal(P)
+    print('%d sets in %.2f s, rejected at 5%%: %.1f%% of the normal, '
+          '%.1f%% of the uniform sets' % (
+              sets, time.perf_counter() - tic,
+              100*np.mean(np.delete(r.pvalue, np.s_[::10]) < 0.05),
+              100*np.mean(r.pvalue[::10] < 0.05)))
@@ -1,61 +1,147 @@
+from collections import namedtuple
+
 import numpy as np
-from scipy.stats import t
 
+from stat_tables import t_value
+
+
+LinregResult = namedtuple(
+    'LinregResult',
+    ['a', 'b', 'RR', 'sxy', 'N', 'nu', 'Sa', 'Sb', 'da', 'db', 'dy'])
+LinregResult.__doc__ = """ y = ax + b fit with standard errors Sa, Sb and
+t-based confidence half widths da, db, dy (dy is for the line at mean x) """
 
-def linreg(X, Y):
+
+class StreamingLinreg:
     """
     Summary
-        Linear regression of y = ax + b
+        Single pass linear regression of y = ax + b over chunks of data
     Usage
-        real, real, real = linreg(list, list)
-    Returns coefficients to the regression line "y=ax+b" from x[] and y[], and R^2 Value
+        acc = StreamingLinreg()
+        for x, y in chunks:
+            acc.update(x, y)
+        a, b, RR, sxy, *_ = acc.result()
+
+    Keeps only the count, the means and the co-moments
+    Sxx = sum (x - mx)^2, Syy = sum (y - my)^2, Sxy = sum (x - mx)(y - my)
+    which are updated with the Welford/Chan formulas, so the result does not
+    suffer from the cancellation of the textbook sums Sx, Sxx, ...
+    Accumulators filled by different workers are combined with merge()
     """
-    N = len(X)
 
-    if N != len(Y):  raise(ValueError, 'unequal length')
+    def __init__(self):
+        self.N = 0
+        self.mx = self.my = 0.0
+        self.Sxx = self.Syy = self.Sxy = 0.0
+
+    def _combine(self, n, mx, my, Sxx, Syy, Sxy):
+        if n == 0:
+            return self
+        N = self.N + n
+        dx, dy = mx - self.mx, my - self.my
+        f = self.N * n / N
+        self.mx += dx * n / N
+        self.my += dy * n / N
+        self.Sxx += Sxx + dx * dx * f
+        self.Syy += Syy + dy * dy * f
+        self.Sxy += Sxy + dx * dy * f
+        self.N = N
+        return self
+
+    def update(self, x, y):
+        """ add a chunk of (x, y) pairs """
+        x = np.asarray(x, dtype=float).ravel()
+        y = np.asarray(y, dtype=float).ravel()
+        if x.size != y.size:
+            raise ValueError('unequal length')
+        if x.size == 0:
+            return self
+        mx, my = x.mean(), y.mean()
+        xc, yc = x - mx, y - my
+        return self._combine(x.size, mx, my, xc @ xc, yc @ yc, xc @ yc)
+
+    def merge(self, other):
+        """ add the data of another accumulator, e.g. from another worker """
+        return self._combine(other.N, other.mx, other.my,
+                             other.Sxx, other.Syy, other.Sxy)
 
-    Sx = Sy = Sxx = Syy = Sxy = 0.0
-    for x, y in zip(X, Y):
-        Sx = Sx + x
-        Sy = Sy + y
-        Sxx = Sxx + x*x
-        Syy = Syy + y*y
-        Sxy = Sxy + x*y
+    def result(self, confidence=0.95):
+        """ regression coefficients, R^2, S_yx and confidence intervals """
+        N = self.N
+        # linear regression, a_0, a_1 => m = 1
+        m = 1
+        nu = N - (m+1)
+        if nu < 1:
+            raise ValueError('at least 3 points are needed')
 
-    det =  Sx * Sx - Sxx * N # see the lecture
+        a = self.Sxy / self.Sxx
+        b = self.my - a * self.mx
+        residual = max(self.Syy - a * self.Sxy, 0.0)
+        RR = 1 - residual/self.Syy
+        sxy = np.sqrt(residual / nu)
 
-    a,b = (Sy * Sx - Sxy * N)/det, (Sx * Sxy - Sxx * Sy)/det
+        Sa = sxy * np.sqrt(1/self.Sxx)
+        Sb = sxy * np.sqrt((self.Sxx + N*self.mx**2)/(N*self.Sxx))
 
-    meanerror = residual = residualx = 0.0
+        # We work with t-distribution, ()
+        # t_{nu;\alpha/2} = t_{3,95} = 3.18
+        tvalue = t_value(confidence, nu)
+
+        return LinregResult(a, b, RR, sxy, N, nu, Sa, Sb,
+                            tvalue*Sa, tvalue*Sb, tvalue*sxy/np.sqrt(N))
+
+
+def linreg(X, Y, verbose=True):
+    """
+    Summary
+        Linear regression of y = ax + b
+    Usage
+        real, real, real, real = linreg(list, list)
+    Returns coefficients to the regression line "y=ax+b" from x[] and y[],
+    R^2 Value and the standard error of the estimate S_yx
+    """
+    if len(X) != len(Y):
+        raise ValueError('unequal length')
 
-    for x, y in zip(X, Y):
-        meanerror = meanerror + (y - Sy/N)**2
-        residual = residual + (y - a * x - b)**2
-        residualx = residualx + (x - Sx/N)**2
+    r = StreamingLinreg().update(X, Y).result()
 
-    RR = 1 - residual/meanerror
-    # linear regression, a_0, a_1 => m = 1
-    m = 1
-    nu = N - (m+1)
+    if verbose:
+        print("Estimate: y = ax + b")
+        print("N = %d" % r.N)
+        print("Degrees of freedom $\\nu$ = %d " % r.nu)
+        print("a = %.2f $\\pm$ %.3f" % (r.a, r.da))
+        print("b = %.2f $\\pm$ %.3f" % (r.b, r.db))
+        print("R^2 = %.3f" % r.RR)
+        print("Syx = %.3f" % r.sxy)
+        print("y = %.2f x + %.2f $\\pm$ %.3f V" % (r.a, r.b, r.dy))
+    return r.a, r.b, r.RR, r.sxy
 
-    sxy = np.sqrt(residual / nu)
 
-    # Var_a, Var_b = ss * N / det, ss * Sxx / det
+def _fit_chunk(chunk):
+    x, y = chunk
+    return StreamingLinreg().update(x, y)
 
-    Sa = sxy * np.sqrt(1/residualx)
-    Sb = sxy * np.sqrt(Sxx/(N*residualx))
 
+if __name__ == '__main__':
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import reduce
 
-    # We work with t-distribution, ()
-    # t_{nu;\alpha/2} = t_{3,95} = 3.18
-    tvalue = t.ppf(1-(1-0.95)/2, nu)
+    X = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    Y = np.array([0.1, 1.1, 2.0, 3.2, 4.1])
+    a, b, RR, sxy = linreg(X, Y)
+    np.testing.assert_allclose([a, b], np.polyfit(X, Y, 1))
 
-    print("Estimate: y = ax + b")
-    print("N = %d" % N)
-    print("Degrees of freedom $\\nu$ = %d " % nu)
-    print("a = %.2f $\\pm$ %.3f" % (a, tvalue*Sa/np.sqrt(N)))
-    print("b = %.2f $\\pm$ %.3f" % (b, tvalue*Sb/np.sqrt(N)))
-    print("R^2 = %.3f" % RR)
-    print("Syx = %.3f" % sxy)
-    print("y = %.2f x + %.2f $\\pm$ %.3f V" % (a, b, tvalue*sxy/np.sqrt(N)))
-    return a, b, RR, sxy
\ No newline at end of file
+    # a long record with a large offset in x, split between workers
+    rng = np.random.default_rng(0)
+    x = 1e6 + rng.uniform(0, 10, 2_000_000)
+    y = 2.5*x - 3.0 + rng.normal(0, 0.1, x.size)
+    chunks = [(x[i:i + 250_000], y[i:i + 250_000])
+              for i in range(0, x.size, 250_000)]
+    with ProcessPoolExecutor() as pool:
+        parts = list(pool.map(_fit_chunk, chunks))
+    r = reduce(StreamingLinreg.merge, parts, StreamingLinreg()).result()
+    print(r)
+    # polyfit of the shifted x is the well-conditioned reference
+    a_ref, b_ref = np.polyfit(x - 1e6, y, 1)
+    np.testing.assert_allclose(r.a, a_ref, rtol=1e-9)
+    np.testing.assert_allclose(r.b + 1e6*r.a, b_ref, rtol=1e-6)
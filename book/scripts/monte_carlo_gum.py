@@ -0,0 +1,213 @@
+""" Monte Carlo propagation of distributions (GUM Supplement 1)
+
+The notebooks theory/uncertainty_propagation_monte_carlo_gum.ipynb and
+theory/simulations_for_uncertainty.ipynb draw all trials in one array.
+Here the trials are drawn in blocks of fixed size, so memory does not
+depend on the number of trials, and the adaptive procedure of GUM-S1
+(clause 7.9) stops when the mean, the standard uncertainty and the ends
+of the coverage interval are stable to the numerical tolerance. The
+per-block quantiles serve only this stability test: the reported interval
+is that of all the trials (7.9.4), from the cumulative counts of the
+merged histogram, interpolated inside the bin:
+
+    from monte_carlo_gum import propagate, Normal, Rectangular
+
+    def volume(h):
+        return h**3
+
+    r = propagate(volume, [Normal(10.02, 0.0062)], ndig=2, workers=4)
+    r.mean, r.u, r.low, r.high
+
+Block i always uses the i-th child of one np.random.SeedSequence, so the
+result for a given seed does not depend on the number of workers. Blocks
+are computed in a process pool, the model must then be a module level
+function (picklable) that takes and returns NumPy arrays.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+class Normal(namedtuple('Normal', 'mean std')):
+    """ Gaussian, N(mean, std^2) """
+    def sample(self, rng, n):
+        return rng.normal(self.mean, self.std, n)
+
+
+class Rectangular(namedtuple('Rectangular', 'mean half_width')):
+    """ uniform on mean +- half_width, u = half_width/sqrt(3) """
+    def sample(self, rng, n):
+        return rng.uniform(self.mean - self.half_width,
+                           self.mean + self.half_width, n)
+
+
+class Triangular(namedtuple('Triangular', 'mean half_width')):
+    """ symmetric triangular on mean +- half_width, u = half_width/sqrt(6) """
+    def sample(self, rng, n):
+        return rng.triangular(self.mean - self.half_width, self.mean,
+                              self.mean + self.half_width, n)
+
+
+class StudentT(namedtuple('StudentT', 'mean scale dof')):
+    """ scaled and shifted t, e.g. mean of N readings: scale = S/sqrt(N),
+    dof = N - 1 (GUM-S1 6.4.9) """
+    def sample(self, rng, n):
+        return self.mean + self.scale*rng.standard_t(self.dof, n)
+
+
+MCResult = namedtuple(
+    'MCResult',
+    ['mean', 'u', 'low', 'high', 'trials', 'blocks', 'converged', 'tol',
+     'counts', 'edges'])
+MCResult.__doc__ = """ estimate, standard uncertainty and coverage interval
+[low, high] of all the trials, the histogram counts/edges approximate the
+PDF of the output """
+
+
+def _run_block(model, inputs, n, seed, coverage, edges):
+    rng = np.random.default_rng(seed)
+    y = np.asarray(model(*[x.sample(rng, n) for x in inputs]), dtype=float)
+    p = (1 - coverage)/2
+    low, high = np.quantile(y, [p, 1 - p])
+    mean = y.mean()
+    M2 = np.sum((y - mean)**2)
+    counts = None
+    if edges is not None:
+        counts = np.histogram(np.clip(y, edges[0], edges[-1]), edges)[0]
+    return y.size, mean, M2, low, high, counts
+
+
+def _interval(counts, edges, coverage):
+    """ probabilistically symmetric coverage interval of a histogram, the
+    distribution function is linear within every bin """
+    cdf = np.r_[0, np.cumsum(counts)]/counts.sum()
+    p = (1 - coverage)/2
+    q = np.array([p, 1 - p])
+    k = np.searchsorted(cdf, q)     # cdf[k - 1] < q <= cdf[k]
+    frac = (q - cdf[k - 1])/(cdf[k] - cdf[k - 1])
+    return edges[k - 1] + frac*(edges[k] - edges[k - 1])
+
+
+def _tolerance(u, ndig):
+    """ GUM-S1 7.9.2: half a unit in the last of ndig significant digits """
+    return 0.5*10.0**(np.floor(np.log10(u)) - ndig + 1)
+
+
+def propagate(model, inputs, ndig=2, tol=None, coverage=0.95,
+              block_size=10**5, max_trials=10**8, workers=None, seed=None,
+              bins=1000):
+    """ adaptive Monte Carlo propagation of the input distributions
+
+    Inputs:
+        model : vectorized function, model(x1, x2, ...) -> y
+        inputs : list of Normal, Rectangular, Triangular or StudentT
+        ndig : significant digits of u(y) for the numerical tolerance
+        tol : absolute numerical tolerance, overrides ndig
+        coverage : coverage probability of the interval [low, high]
+        block_size : trials per block, sets the memory use
+        max_trials : stop here even if not converged
+        workers : number of processes, None or 1 runs in this process
+        seed : seed of the np.random.SeedSequence
+        bins : bins of the histogram on mean +- 8 u of a pilot block,
+            the coverage interval is read from it
+
+    Returns:
+        MCResult
+    """
+    seeds = np.random.SeedSequence(seed)
+    max_blocks = max(1, int(max_trials // block_size))
+    wave = workers or 1
+
+    # a pilot block fixes the histogram range, clipped values land in
+    # the first and last bins
+    n, mean, M2, low, high, _ = _run_block(model, inputs, block_size,
+                                           seeds.spawn(1)[0], coverage, None)
+    u = np.sqrt(M2/(n - 1))
+    edges = np.linspace(mean - 8*u, mean + 8*u, bins + 1)
+    counts = np.zeros(bins, dtype=np.int64)
+    blocks = []  # per block mean, u, low, high: 4 numbers per block
+    delta = tol
+    N, total_mean, total_M2 = 0, 0.0, 0.0
+
+    pool = ProcessPoolExecutor(workers) if wave > 1 else None
+    try:
+        converged = False
+        while not converged and len(blocks) < max_blocks:
+            children = seeds.spawn(min(wave, max_blocks - len(blocks)))
+            args = (model, inputs, block_size)
+            if pool is None:
+                results = [_run_block(*args, s, coverage, edges)
+                           for s in children]
+            else:
+                results = list(pool.map(
+                    _run_block, *zip(*[args + (s, coverage, edges)
+                                       for s in children])))
+
+            for n, mean, M2, low, high, c in results:
+                # Chan et al. merge of the running moments
+                d = mean - total_mean
+                total_mean += d*n/(N + n)
+                total_M2 += M2 + d**2*N*n/(N + n)
+                N += n
+                counts += c
+                blocks.append((mean, np.sqrt(M2/(n - 1)), low, high))
+
+                h = len(blocks)
+                if h < 2:
+                    continue
+                b = np.array(blocks)
+                if tol is None:
+                    delta = _tolerance(b[:, 1].mean(), ndig)
+                # GUM-S1 7.9.4: 2 s < delta for all four block averages,
+                # checked after every block so that the blocks left in a
+                # wave do not change the result
+                s = b.std(axis=0, ddof=1)/np.sqrt(h)
+                converged = bool(np.all(2*s <= delta))
+                if converged:
+                    break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    low, high = _interval(counts, edges, coverage)
+    return MCResult(total_mean, np.sqrt(total_M2/(N - 1)), low, high, N,
+                    len(blocks), converged, delta, counts, edges)
+
+
+def _cube_volume(h):
+    return h**3
+
+
+if __name__ == '__main__':
+    import time
+
+    # the cube of uncertainty_propagation_monte_carlo_gum.ipynb
+    height = np.array([10.02, 10.03, 10.01, 10.02, 10.03, 10.02, 10.01, 10.02,
+                       10.03, 10.02])
+    resolution = 0.01  # mm
+    N = height.size
+    inputs = [StudentT(height.mean(), height.std(ddof=1)/np.sqrt(N), N - 1),
+              Rectangular(0.0, resolution/2)]
+
+    def volume(h, e):
+        return (h + e)**3
+
+    r = propagate(volume, inputs, ndig=2, seed=1)
+    print('V = %.3f mm^3, u = %.3f, 95%% [%.3f, %.3f], %d trials'
+          % (r.mean, r.u, r.low, r.high, r.trials))
+
+    # the interval of all the trials against the exact one of a normal
+    # output, within the numerical tolerance
+    r = propagate(lambda x: x, [Normal(0.0, 1.0)], ndig=3, seed=3)
+    print('N(0, 1): 95%% [%.4f, %.4f], tolerance %.4f, %d trials'
+          % (r.low, r.high, r.tol, r.trials))
+    np.testing.assert_allclose([r.low, r.high], [-1.959964, 1.959964],
+                               atol=r.tol)
+    for workers in (1, 4):
+        tic = time.perf_counter()
+        r = propagate(_cube_volume, [Normal(10.0, 0.01)], ndig=3,
+                      block_size=10**6, workers=workers, seed=42)
+        print('%d workers: %.2f s, %d trials, u = %.6f (%.6f analytical), '
+              'converged %s' % (workers, time.perf_counter() - tic, r.trials,
+                                r.u, 3*10.0**2*0.01, r.converged))
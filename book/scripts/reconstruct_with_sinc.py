@@ -1,38 +1,182 @@
 # %%
+import time
+
 import numpy as np
 import matplotlib.pyplot as plt
-def reconstruct_with_sinc(ts,fd,t):
+
+
+def reconstruct_with_sinc_loop(ts, fd, t):
+    """ reference implementation: double loop over output times and samples
+
+    Kept for teaching and for checking the vectorized version below, note
+    that it divides by zero when t lands exactly on a sample time
+    """
     n, = ts.shape
     dt = ts[1] - ts[0]
     fr = []
-    for k,ti in enumerate(t):
+    for k, ti in enumerate(t):
         # for each time point
         sumf = 0.0
         for i in range(n):
             # for each point in a sampled set
             sumf += fd[i]*np.sin(np.pi*(ti/dt-i))/(ti/dt-i)
-            
-        
+
         fr.append((1./np.pi)*sumf)
-        
-    return np.asarray(fr,dtype='f')
+
+    return np.asarray(fr, dtype='f')
+
+
+def reconstruct_with_sinc(ts, fd, t, neighbours=None, max_elements=2**22):
+    """ Whittaker-Shannon (cardinal series) reconstruction of sampled data
+
+    f(t) = sum_i fd[i] sinc((t - ts[0])/dt - i)
+
+    Inputs:
+        ts : uniformly spaced sampling times
+        fd : sampled values, same length as ts
+        t : output times, any order and spacing
+        neighbours : None for the full series, O(n*m), or K for a
+            Lanczos-windowed kernel using the K nearest samples on each
+            side of every output time, O(m*K)
+        max_elements : size of the (output chunk x kernel) matrix kept in
+            memory at once, 2**22 float64 values are 32 MB
+
+    Returns:
+        fr : reconstructed values at t
+    """
+    ts = np.asarray(ts, dtype=float)
+    fd = np.asarray(fd, dtype=float)
+    t = np.asarray(t, dtype=float)
+    n, = ts.shape
+    if fd.shape != ts.shape:
+        raise ValueError('ts and fd must have the same length')
+
+    dt = ts[1] - ts[0]
+    u = (t.ravel() - ts[0])/dt  # output times in units of samples
+    fr = np.empty_like(u)
+
+    if neighbours is None:
+        i = np.arange(n)
+        chunk = max(1, max_elements // n)
+        for start in range(0, u.size, chunk):
+            stop = start + chunk
+            # np.sinc is sin(pi x)/(pi x) and equals 1 at x = 0
+            fr[start:stop] = np.sinc(u[start:stop, None] - i) @ fd
+    else:
+        K = int(neighbours)
+        offsets = np.arange(-K + 1, K + 1)
+        chunk = max(1, max_elements // offsets.size)
+        for start in range(0, u.size, chunk):
+            uc = u[start:start + chunk, None]
+            idx = np.floor(uc).astype(np.intp) + offsets
+            x = uc - idx
+            w = np.sinc(x)*np.sinc(x/K)
+            # samples outside the record contribute nothing
+            valid = (idx >= 0) & (idx < n)
+            w[~valid] = 0.0
+            fr[start:start + chunk] = (w*fd[np.clip(idx, 0, n - 1)]).sum(axis=1)
+
+    return fr.reshape(t.shape)
+
+
+def reconstruct_with_fft(ts, fd, factor):
+    """ band-limited interpolation of one period of a periodic signal
+
+    The spectrum of fd is zero-padded to factor*n points, which is the
+    exact cardinal series of the periodically extended record, O(N log N)
+
+    Inputs:
+        ts : uniformly spaced sampling times covering exactly one period
+        fd : sampled values
+        factor : integer upsampling factor
+
+    Returns:
+        t, fr : output times with spacing dt/factor and the reconstruction
+    """
+    fd = np.asarray(fd, dtype=float)
+    n = fd.size
+    m = int(factor)*n
+    F = np.fft.rfft(fd)
+    if n % 2 == 0:
+        # the Nyquist bin is shared between +fs/2 and -fs/2
+        F[-1] *= 0.5
+    fr = np.fft.irfft(F, m)*(m/n)
+
+    dt = ts[1] - ts[0]
+    t = ts[0] + np.arange(m)*dt/factor
+    return t, fr
+
 
 # %%
 if __name__ == '__main__':
-    t = np.arange(0.0,0.6,0.001)
+    t = np.arange(0.0, 0.6, 0.001)
     fa = 1.0*np.sin(2*np.pi*10*t)+0.2*np.sin(2*np.pi*6*t)
-    fs = 10 # Hz
-    ts = np.arange(0.0,0.6,1./fs) # sampling time
-    fd = 1.0*np.sin(2*np.pi*10*ts)+0.2*np.sin(2*np.pi*6*ts) # sampled data
-    
-    
+    fs = 10  # Hz
+    ts = np.arange(0.0, 0.6, 1./fs)  # sampling time
+    fd = 1.0*np.sin(2*np.pi*10*ts)+0.2*np.sin(2*np.pi*6*ts)  # sampled data
+
+    # output times between the samples, the loop cannot evaluate on them
+    t_off = t[np.abs(t*fs - np.round(t*fs)) > 1e-6]
+
+    tic = time.perf_counter()
+    fr_loop = reconstruct_with_sinc_loop(ts, fd, t_off)
+    t_loop = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    fr_full = reconstruct_with_sinc(ts, fd, t_off, max_elements=1000)
+    t_full = time.perf_counter() - tic
+    # the loop returns float32
+    np.testing.assert_allclose(fr_full, fr_loop, atol=1e-5)
+
+    # on the sample times the series returns the samples themselves
+    np.testing.assert_allclose(reconstruct_with_sinc(ts, fd, ts), fd, atol=1e-12)
+
+    # K = 8 reaches all the 6 samples, it differs from the full series only
+    # by the Lanczos taper: 1.4e-2 of the unit amplitude
+    fr_k = reconstruct_with_sinc(ts, fd, t_off, neighbours=8)
+    np.testing.assert_allclose(fr_k, fr_loop, atol=2e-2)
+    print('fs = %d Hz, loop: %.4f s, vectorized: %.4f s' % (fs, t_loop, t_full))
+    print('max |full - loop| = %.2e, max |K=8 - loop| = %.2e'
+          % (np.max(np.abs(fr_full - fr_loop)), np.max(np.abs(fr_k - fr_loop))))
+
+    plt.figure()
+    fr = reconstruct_with_sinc(ts, fd, t)
+    plt.plot(t, fa, 'b-', ts, fd, 'ro', t, fr, 'g--')
+    plt.xlabel('t [sec]')
+    plt.ylabel('y [V]')
+    plt.legend(('Original', 'Sampled', 'Reconstructed'))
+
+    # above the Nyquist rate, 18 samples: K = 8 truncates the series, the
+    # error against the loop stays below 0.1 (7.1e-2), K = 64 spans the
+    # record and is within 5e-3 (2.1e-3)
+    fs = 30  # Hz
+    ts = np.arange(0.0, 0.6, 1./fs)
+    fd = 1.0*np.sin(2*np.pi*10*ts)+0.2*np.sin(2*np.pi*6*ts)
+    t_off = t[np.abs(t*fs - np.round(t*fs)) > 1e-6]
+    fr_loop = reconstruct_with_sinc_loop(ts, fd, t_off)
+    np.testing.assert_allclose(reconstruct_with_sinc(ts, fd, t_off), fr_loop,
+                               atol=1e-5)
+    fr_k = reconstruct_with_sinc(ts, fd, t_off, neighbours=8)
+    np.testing.assert_allclose(fr_k, fr_loop, atol=0.1)
+    np.testing.assert_allclose(
+        reconstruct_with_sinc(ts, fd, t_off, neighbours=64), fr_loop,
+        atol=5e-3)
+    print('fs = %d Hz, max |K=8 - loop| = %.2e'
+          % (fs, np.max(np.abs(fr_k - fr_loop))))
+
+    # 0.6 s holds an integer number of periods of 10 Hz and 5 Hz
+    fp = np.sin(2*np.pi*10*ts) + 0.2*np.sin(2*np.pi*5*ts)
+    tf, fr_fft = reconstruct_with_fft(ts, fp, 30)
+    np.testing.assert_allclose(
+        fr_fft, np.sin(2*np.pi*10*tf) + 0.2*np.sin(2*np.pi*5*tf), atol=1e-10)
+
     plt.figure()
-    fr = reconstruct_with_sinc(ts,fd,t)
-    plt.plot(t,fa,'b-',ts,fd,'ro',t,fr,'g--')
+    plt.plot(t, 1.0*np.sin(2*np.pi*10*t)+0.2*np.sin(2*np.pi*6*t), 'b-',
+             ts, fd, 'ro', t, reconstruct_with_sinc(ts, fd, t), 'g--',
+             t, reconstruct_with_sinc(ts, fd, t, neighbours=8), 'k:')
     plt.xlabel('t [sec]')
     plt.ylabel('y [V]')
-    plt.legend(('Original','Sampled','Reconstructed'))
+    plt.legend(('Original', 'Sampled', 'Reconstructed', 'K = 8'))
     plt.show()
 
 # %%
-    
@@ -0,0 +1,182 @@
+""" Bootstrap and jackknife uncertainty of calibration coefficients
+
+theory/uncertainty_of_a_slope.ipynb draws the extreme lines through the
+error bars of the U-I data by hand, and linear_regression.py gives the
+analytic intervals that assume normal residuals. Resampling needs no such
+assumption:
+
+    from resampling import bootstrap, jackknife
+    r = bootstrap(U, I, B=10**5)          # polyfit order: slope, intercept
+    r.coef, r.se, r.low, r.high
+    j = jackknife(U, I)
+
+bootstrap: the B resamples are rows of an (B, n) index matrix, x[idx] and
+y[idx] give all the data sets at once and the normal equations of all the
+fits are solved in one batched np.linalg.solve. Resamples with fewer
+distinct x than coefficients cannot be fitted and are left out. Large B is
+processed in chunks, chunk i always uses the i-th child of one
+np.random.SeedSequence, so the result does not depend on the number of
+workers.
+
+jackknife: the leave-one-out coefficients follow from the full fit
+without refitting,
+
+    beta_(i) = beta - (X'X)^{-1} x_i e_i/(1 - h_ii)
+
+with the residual e_i and the leverage h_ii of point i.
+
+x is centred and scaled before the fits, so that high orders and large
+offsets are well conditioned.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from stat_tables import t_value
+
+BootstrapResult = namedtuple('BootstrapResult',
+                             ['coef', 'se', 'low', 'high', 'replicates'])
+BootstrapResult.__doc__ = """ least squares coefficients (highest power
+first, as np.polyfit), bootstrap standard errors, percentile interval and
+the (B, deg+1) replicates, NaN for the resamples that cannot be fitted """
+
+JackknifeResult = namedtuple('JackknifeResult',
+                             ['coef', 'bias', 'se', 'low', 'high',
+                              'replicates'])
+JackknifeResult.__doc__ = """ least squares coefficients, jackknife bias
+and standard error, t interval with n - 1 degrees of freedom and the
+(n, deg+1) leave-one-out coefficients """
+
+
+def _scaling(x, deg):
+    """ centre, scale and the matrix from coefficients of t = (x - xm)/xs
+    (lowest power first) to np.polyfit coefficients of x """
+    xm, xs = x.mean(), x.std() or 1.0
+    M = np.zeros((deg + 1, deg + 1))
+    for k in range(deg + 1):
+        p = np.polynomial.Polynomial([-xm/xs, 1/xs])**k
+        M[:len(p.coef), k] = p.coef
+    return xm, xs, M[::-1]
+
+
+def _fit_resamples(x, y, deg, idx):
+    """ coefficients in t of the resamples idx (B, n), NaN if singular """
+    t, yb = x[idx], y[idx]
+    V = t[..., None]**np.arange(deg + 1)                # (B, n, deg+1)
+    A = np.einsum('bni,bnj->bij', V, V)
+    g = np.einsum('bni,bn->bi', V, yb)
+    # fewer distinct x than coefficients: singular normal equations
+    s = np.sort(t, axis=1)
+    bad = 1 + np.count_nonzero(np.diff(s, axis=1) > 0, axis=1) <= deg
+    A[bad] = np.eye(deg + 1)
+    c = np.linalg.solve(A, g[..., None])[..., 0]
+    c[bad] = np.nan
+    return c
+
+
+def _bootstrap_chunk(args):
+    t, y, deg, size, seed = args
+    rng = np.random.default_rng(seed)
+    return _fit_resamples(t, y, deg, rng.integers(0, t.size, (size, t.size)))
+
+
+def bootstrap(x, y, deg=1, B=10**5, confidence=0.95, chunk=10**4,
+              workers=None, seed=None):
+    """ pairs bootstrap of the polynomial fit y(x) of degree deg
+
+    Inputs:
+        x, y : (n,) calibration data
+        B : number of resamples
+        confidence : level of the percentile interval
+        chunk : resamples per batched solve, bounds the memory to about
+            chunk*n*(deg+2) numbers
+        workers : > 1 solves the chunks in a process pool
+        seed : seed of the np.random.SeedSequence
+
+    Returns:
+        BootstrapResult
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    xm, xs, M = _scaling(x, deg)
+    t = (x - xm)/xs
+
+    sizes = [min(chunk, B - i) for i in range(0, B, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(t, y, deg, n, s) for n, s in zip(sizes, seeds)]
+    if workers and workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_bootstrap_chunk, jobs))
+    else:
+        parts = [_bootstrap_chunk(job) for job in jobs]
+    replicates = np.concatenate(parts) @ M.T
+
+    coef = np.polyfit(t, y, deg)[::-1] @ M.T
+    alpha = 1 - confidence
+    low, high = np.nanpercentile(replicates, [100*alpha/2,
+                                              100*(1 - alpha/2)], axis=0)
+    return BootstrapResult(coef, np.nanstd(replicates, axis=0, ddof=1),
+                           low, high, replicates)
+
+
+def jackknife(x, y, deg=1, confidence=0.95):
+    """ leave-one-out jackknife of the polynomial fit, no refitting
+
+    Returns:
+        JackknifeResult
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = x.size
+    xm, xs, M = _scaling(x, deg)
+    V = ((x - xm)/xs)[:, None]**np.arange(deg + 1)      # (n, deg+1)
+    Ainv = np.linalg.inv(V.T @ V)
+    beta = Ainv @ V.T @ y
+    e = y - V @ beta
+    G = V @ Ainv                                        # rows x_i' A^-1
+    h = np.einsum('ni,ni->n', G, V)
+    replicates = (beta - G*(e/(1 - h))[:, None]) @ M.T
+
+    coef = beta @ M.T
+    mean = replicates.mean(axis=0)
+    bias = (n - 1)*(mean - coef)
+    se = np.sqrt((n - 1)/n*np.sum((replicates - mean)**2, axis=0))
+    d = t_value(confidence, n - 1)*se
+    return JackknifeResult(coef, bias, se, coef - bias - d, coef - bias + d,
+                           replicates)
+
+
+if __name__ == '__main__':
+    import time
+
+    # uncertainty_of_a_slope.ipynb
+    U = np.array([4.5, 6, 7, 8, 9, 10])
+    I = np.array([109.5, 115.3, 129.2, 134.8, 142.1, 144.6])
+
+    j = jackknife(U, I)
+    np.testing.assert_allclose(j.replicates, [
+        np.polyfit(np.delete(U, i), np.delete(I, i), 1)
+        for i in range(U.size)])
+    tic = time.perf_counter()
+    r = bootstrap(U, I, B=10**5, seed=16)
+    print('B = 10^5 in %.2f s' % (time.perf_counter() - tic))
+    for name, k in (('slope', 0), ('intercept', 1)):
+        print('%-9s %7.2f  bootstrap [%6.2f, %6.2f]  jackknife [%6.2f, %6.2f]'
+              % (name, r.coef[k], r.low[k], r.high[k], j.low[k], j.high[k]))
+
+    # the number of workers does not change the replicates
+    r2 = bootstrap(U, I, B=10**5, seed=16, workers=4)
+    np.testing.assert_array_equal(r.replicates, r2.replicates)
+
+    # a second order calibration with an offset in x
+    rng = np.random.default_rng(16)
+    x = 1000 + np.linspace(0, 10, 40)
+    y = 0.02*(x - 1000)**2 + 3*x + rng.normal(0, 0.1, x.size)
+    r = bootstrap(x, y, deg=2, B=20000, seed=1)
+    j = jackknife(x, y, deg=2)
+    np.testing.assert_allclose(np.polyval(r.coef, x), np.polyval(
+        np.polyfit(x - 1000, y, 2), x - 1000), rtol=1e-9)
+    print('quadratic: se bootstrap %s, jackknife %s'
+          % (np.array2string(r.se, precision=2),
+             np.array2string(j.se, precision=2)))
@@ -0,0 +1,209 @@
+""" Surface roughness parameters with the ISO 16610-21 Gaussian filter
+
+theory/surface_roughness_budget.ipynb separates the roughness from the
+simulated profile with a moving average of lc/dx points (np.convolve,
+O(N lc/dx) operations) and needs the whole profile in memory. Here the
+mean line is the Gaussian profile filter of ISO 16610-21,
+
+    s(x) = exp(-pi (x/(alpha lc))^2)/(alpha lc),  alpha = sqrt(ln 2/pi)
+
+which transmits 50 % of the amplitude at the cut-off wavelength lc. It is
+applied by FFT convolution (scipy.signal.oaconvolve) chunk by chunk: the
+kernel is truncated at +-lc, the last 2 lc of the profile are kept between
+chunks, and a full cut-off lc at both ends of the trace is not evaluated.
+The parameters are computed in one pass from running sums of the
+roughness profile z:
+
+    Ra = mean|z|, Rq = sqrt(mean z^2), Rsk = mean z^3/Rq^3,
+    Rku = mean z^4/Rq^4, Rp = max z, Rv = -min z, Rt = Rp + Rv,
+    Rz = mean over the sampling lengths (lc) of their max z - min z
+
+    from roughness import StreamingRoughness, roughness
+    rough = StreamingRoughness(dx=0.5e-3, lc=0.8)   # [mm]
+    for chunk in trace:                  # (points,) or (traces, points)
+        rough.update(chunk)
+    rough.result().Ra
+    roughness(profiles, dx, lc)          # whole traces in rows
+
+Many traces are evaluated together as the rows of a 2D chunk.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+ALPHA = np.sqrt(np.log(2)/np.pi)
+
+Roughness = namedtuple('Roughness', ['Ra', 'Rq', 'Rsk', 'Rku', 'Rp', 'Rv',
+                                     'Rt', 'Rz', 'n', 'sections'])
+Roughness.__doc__ = """ roughness parameters (in the units of the profile)
+of every trace, the number of evaluated points and of complete sampling
+lengths that make Rz """
+
+
+@lru_cache(maxsize=32)
+def gaussian_kernel(dx, lc):
+    """ read-only Gaussian weighting function on +-lc, normalized to 1 """
+    half = int(np.ceil(lc/dx))
+    x = np.arange(-half, half + 1)*dx
+    s = np.exp(-np.pi*(x/(ALPHA*lc))**2)
+    s /= s.sum()
+    s.flags.writeable = False
+    return s
+
+
+def mean_line(z, dx, lc=0.8):
+    """ Gaussian mean line of the profiles z (..., points), without lc
+    (half the kernel) at both ends """
+    s = gaussian_kernel(float(dx), float(lc))
+    z = np.asarray(z, dtype=float)
+    return signal.oaconvolve(z, s.reshape((1,)*(z.ndim - 1) + (-1,)),
+                             mode='valid', axes=-1)
+
+
+class StreamingRoughness:
+    """ roughness of one or many traces given in chunks along the trace
+
+    dx : sampling interval
+    lc : cut-off wavelength, also the sampling length of Rz
+    """
+
+    def __init__(self, dx, lc=0.8):
+        self.dx, self.lc = float(dx), float(lc)
+        self.kernel = gaussian_kernel(self.dx, self.lc)
+        self.half = self.kernel.size//2
+        self.section = max(int(round(self.lc/self.dx)), 1)
+        self.n = 0              # evaluated points per trace
+        self._tail = None
+        self._sums = None       # sum |z|, z^2, z^3, z^4
+        self._max = self._min = None
+        self._sec_max = self._sec_min = None    # open sampling length
+        self._rz = None         # sum of max - min of complete sections
+        self._sections = 0
+
+    def _start(self, shape):
+        self._sums = np.zeros((4,) + shape)
+        self._max, self._min = np.full(shape, -np.inf), np.full(shape, np.inf)
+        self._sec_max = np.full(shape, -np.inf)
+        self._sec_min = np.full(shape, np.inf)
+        self._rz = np.zeros(shape)
+
+    def update(self, chunk):
+        """ add the next points of the traces, returns the roughness
+        profile that became available (delayed by lc) """
+        chunk = np.asarray(chunk, dtype=float)
+        ext = chunk if self._tail is None else np.concatenate(
+            [self._tail, chunk], axis=-1)
+        h = self.half
+        if ext.shape[-1] <= 2*h:
+            self._tail = ext
+            return ext[..., :0]
+        z = ext[..., h:-h] - mean_line(ext, self.dx, self.lc)
+        self._tail = ext[..., -2*h:].copy()
+        self._accumulate(z)
+        return z
+
+    def _accumulate(self, z):
+        if self._sums is None:
+            self._start(z.shape[:-1])
+        m = z.shape[-1]
+        z2 = z*z
+        self._sums[0] += np.abs(z).sum(axis=-1)
+        self._sums[1] += z2.sum(axis=-1)
+        self._sums[2] += (z2*z).sum(axis=-1)
+        self._sums[3] += (z2*z2).sum(axis=-1)
+        np.maximum(self._max, z.max(axis=-1), out=self._max)
+        np.minimum(self._min, z.min(axis=-1), out=self._min)
+
+        # extremes of the sampling lengths within the chunk, the first one
+        # continues the open section of the previous chunk
+        sec = (self.n + np.arange(m))//self.section
+        first = np.flatnonzero(np.r_[True, sec[1:] != sec[:-1]])
+        hi = np.maximum.reduceat(z, first, axis=-1)
+        lo = np.minimum.reduceat(z, first, axis=-1)
+        np.maximum(hi[..., 0], self._sec_max, out=hi[..., 0])
+        np.minimum(lo[..., 0], self._sec_min, out=lo[..., 0])
+        self.n += m
+        closed = (sec[first] + 1)*self.section <= self.n
+        self._rz += np.sum((hi - lo)[..., closed], axis=-1)
+        self._sections += np.count_nonzero(closed)
+        if closed[-1]:
+            self._sec_max[...], self._sec_min[...] = -np.inf, np.inf
+        else:
+            self._sec_max, self._sec_min = hi[..., -1], lo[..., -1]
+
+    def result(self):
+        """ Roughness of the points evaluated so far """
+        Ra, Rq2, R3, R4 = self._sums/self.n
+        Rq = np.sqrt(Rq2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            Rz = self._rz/self._sections
+        return Roughness(Ra, Rq, R3/Rq**3, R4/Rq2**2, self._max, -self._min,
+                         self._max - self._min, Rz, self.n, self._sections)
+
+
+def roughness(profiles, dx, lc=0.8):
+    """ Roughness of the whole traces, one per row of profiles """
+    rough = StreamingRoughness(dx, lc)
+    rough.update(profiles)
+    return rough.result()
+
+
+if __name__ == '__main__':
+    import time
+    from scipy import stats
+
+    # the notebook profile: 4 mm at 1 um, lc = 0.8 mm
+    rng = np.random.default_rng(42)
+    L, dx, lc = 4.0, 0.001, 0.8
+    x = np.arange(0, L + dx, dx)
+    form = 0.5*np.sin(2*np.pi*x/L)
+    waviness = 0.3*np.sin(2*np.pi*x/0.8) + 0.2*np.cos(2*np.pi*x/0.6)
+    rough = 0.8*rng.normal(0, 0.4, x.size)
+    rough += 0.6*np.sin(2*np.pi*x/0.05)*np.exp(-x/2.0)
+    profile = form + waviness + rough
+
+    # 50 % transmission of a sine of wavelength lc
+    s = gaussian_kernel(dx, lc)
+    gain = np.abs(np.sum(s*np.exp(2j*np.pi*np.arange(s.size)*dx/lc)))
+    np.testing.assert_allclose(gain, 0.5, atol=1e-6)
+    print('kernel of %d points, transmission at lc = %.4f' % (s.size, gain))
+
+    r = roughness(profile, dx, lc)
+    z = profile[s.size//2:-(s.size//2)] - np.convolve(profile, s, 'valid')
+    np.testing.assert_allclose([r.Ra, r.Rq, r.Rt], [
+        np.mean(np.abs(z)), np.sqrt(np.mean(z**2)), np.ptp(z)])
+    np.testing.assert_allclose(r.Rsk, stats.skew(z), atol=0.02)
+    print('Gaussian filter, %d of %d points: Ra %.3f Rq %.3f Rt %.3f '
+          'Rz %.3f (%d sampling lengths) Rsk %.3f Rku %.3f' % (
+              r.n, x.size, r.Ra, r.Rq, r.Rt, r.Rz, r.sections, r.Rsk, r.Rku))
+
+    # any chunking gives the same parameters
+    det = StreamingRoughness(dx, lc)
+    for chunk in np.array_split(profile, [5, 900, 910, 2500]):
+        det.update(chunk)
+    np.testing.assert_allclose(det.result(), r)
+    sections = [np.ptp(z[i:i + 800]) for i in range(0, z.size - 799, 800)]
+    np.testing.assert_allclose(r.Rz, np.mean(sections))
+
+    # a trace of 10^7 points at 0.5 um streamed in chunks
+    dx = 0.5e-3
+    det = StreamingRoughness(dx, lc)
+    tic = time.perf_counter()
+    for i in range(40):
+        det.update(0.4*rng.standard_normal(250000))
+    r = det.result()
+    seconds = time.perf_counter() - tic
+    # white noise minus its mean line: Rq^2 = 0.4^2 (1 - 2 s_0 + sum s^2)
+    s = gaussian_kernel(dx, lc)
+    Ra = 0.4*np.sqrt(2/np.pi*(1 - 2*s[s.size//2] + np.dot(s, s)))
+    print('10^7 points in %.2f s, %.0f Mpoints/s, Ra = %.4f (%.4f expected)'
+          % (seconds, 1e7/seconds/1e6, r.Ra, Ra))
+
+    # 256 traces of 8 mm in one call
+    profiles = 0.4*rng.standard_normal((256, 16001))
+    tic = time.perf_counter()
+    r = roughness(profiles, dx, lc)
+    print('256 traces x 16001 points in %.2f s, Ra = %.4f +- %.4f'
+          % (time.perf_counter() - tic, r.Ra.mean(), r.Ra.std()))
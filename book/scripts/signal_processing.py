@@ -1,6 +1,7 @@
 from scipy import fft
 import numpy as np
 import matplotlib.pyplot as plt
+from synthesizer import tones
 # redefine default figure size and fonts
 import matplotlib as mpl
 mpl.rc('font', size=14)
@@ -8,16 +9,13 @@ mpl.rc('figure', figsize=(12, 10))
 
 
 # create signal
-def create_signal(fs, N, a=[1., 1.5], f=[10.0, 35.7], DC=0):
+def create_signal(fs, N, a=[1., 1.5], f=[10.0, 35.7], DC=0, rng=None):
     """ create a periodic signal with a DC and a Gaussian noise"""
     dt = 1./fs
     t = np.linspace(0, N*dt, N)
-    y = np.random.normal(0, 1, N) + DC
-    for aa, ff in zip(a, f):
-        y += aa*np.sin(2*np.pi*ff*t)
-
-    noise = np.random.normal(0, 1, N)
-    y += noise
+    rng = np.random.default_rng() if rng is None else rng
+    y = tones(t, a, f)
+    y += DC + rng.standard_normal(N)
     return t, y
 
 
@@ -33,9 +31,9 @@ def spectrum(y, Fs):
     k = np.arange(n)
     T = n/Fs
     frq = k/T  # two sides frequency range
-    frq = frq[range(np.int(n/2))]  # one side frequency range
+    frq = frq[range(n//2)]  # one side frequency range
     Y = 2*fft.fft(y)/n  # fft computing and normalization
-    Y = Y[range(np.int(n/2))]
+    Y = Y[range(n//2)]
     return (frq, Y)
 
 
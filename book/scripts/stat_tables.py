@@ -0,0 +1,137 @@
+""" Cached quantiles of the Student t, chi^2 and normal distributions
+
+The same (confidence, degrees of freedom) pairs are looked up over and
+over in reporting loops, and every scipy.stats call costs tens of
+microseconds. The quantiles are memoized here in a bounded LRU cache,
+arrays of degrees of freedom are reduced to their unique values first;
+arrays with more than MAX_CACHED distinct values (e.g. the effective
+degrees of freedom of thousands of budgets) are evaluated in one
+vectorized scipy call instead, which does not evict the cache.
+
+    from stat_tables import t_value, mean_confidence_interval
+    t_value(0.95, 19)          # two-tail, equivalent to Excel TINV(0.05,19)
+    t_value(0.95, [3, 9, 19])
+    mean, dx = mean_confidence_interval(data, axis=0)
+    cache_info()               # hits and misses
+"""
+from functools import lru_cache
+
+import numpy as np
+from scipy import stats
+
+
+MAX_CACHED = 256
+
+
+def _scipy_ppf(dist, q, dof):
+    if dist == 't':
+        return stats.t.ppf(q, dof)
+    if dist == 'chi2':
+        return stats.chi2.ppf(q, dof)
+    return stats.norm.ppf(q)
+
+
+@lru_cache(maxsize=4096)
+def _ppf(dist, q, dof):
+    return float(_scipy_ppf(dist, q, dof))
+
+
+def _lookup(dist, q, dof=None):
+    q = np.asarray(q, dtype=float)
+    # the normal quantile has no dof: a fixed key, NaN never compares equal
+    dof = np.asarray(0.0 if dof is None else dof, dtype=float)
+    q, dof = np.broadcast_arrays(q, dof)
+    if q.ndim == 0:
+        return _ppf(dist, float(q), float(dof))
+    pairs, inverse = np.unique(np.stack([q.ravel(), dof.ravel()], axis=1),
+                               axis=0, return_inverse=True)
+    if len(pairs) > MAX_CACHED:
+        values = _scipy_ppf(dist, pairs[:, 0], pairs[:, 1])
+    else:
+        values = np.array([_ppf(dist, qq, dd) for qq, dd in pairs])
+    return values[inverse.ravel()].reshape(q.shape)
+
+
+def t_value(confidence, dof, two_sided=True):
+    """ Student t quantile for a confidence level, e.g. t_{nu,95} """
+    alpha = 1 - np.asarray(confidence, dtype=float)
+    return _lookup('t', 1 - alpha/2 if two_sided else 1 - alpha, dof)
+
+
+def t_ppf(q, dof):
+    """ cached scipy.stats.t.ppf(q, dof), t.isf(a, dof) is t_ppf(1-a, dof) """
+    return _lookup('t', q, dof)
+
+
+def chi2_ppf(q, dof):
+    """ cached scipy.stats.chi2.ppf(q, dof) """
+    return _lookup('chi2', q, dof)
+
+
+def norm_ppf(q):
+    """ cached scipy.stats.norm.ppf(q) """
+    return _lookup('norm', q)
+
+
+def cache_info():
+    """ hits, misses, maxsize and currsize of the quantile cache """
+    return _ppf.cache_info()
+
+
+def cache_clear():
+    _ppf.cache_clear()
+
+
+def mean_confidence_interval(x, axis=-1, level=0.95):
+    """ sample mean and the half width t_{nu,level} S / sqrt(N)
+
+    Works along any axis of an array, NaN values are ignored so that each
+    slice has its own N and nu = N - 1
+    """
+    x = np.asarray(x, dtype=float)
+    N = np.sum(~np.isnan(x), axis=axis)
+    mean = np.nanmean(x, axis=axis)
+    S = np.nanstd(x, axis=axis, ddof=1)
+    nu = np.maximum(N - 1, 1)
+    return mean, t_value(level, nu)*S/np.sqrt(N)
+
+
+if __name__ == '__main__':
+    import time
+
+    # the example of t-distribution.py
+    print('t = %.3f' % t_value(0.95, 19))
+
+    rng = np.random.default_rng(3)
+    data = rng.normal(8.24, 0.314, (20, 1000))  # 1000 channels
+    mean, dx = mean_confidence_interval(data, axis=0)
+    np.testing.assert_allclose(
+        dx, stats.t.ppf(0.975, 19)*data.std(axis=0, ddof=1)/np.sqrt(20))
+
+    # per-channel reporting loop
+    dofs = rng.integers(3, 30, 20000)
+    tic = time.perf_counter()
+    direct = [stats.t.ppf(0.975, d) for d in dofs]
+    t_scipy = time.perf_counter() - tic
+    tic = time.perf_counter()
+    cached = [t_value(0.95, d) for d in dofs]
+    t_cached = time.perf_counter() - tic
+    np.testing.assert_allclose(cached, direct)
+    print('scipy %.3f s, cached %.3f s, %s'
+          % (t_scipy, t_cached, cache_info()))
+
+    # the normal quantile: one scipy call for repeated levels
+    cache_clear()
+    norm_ppf(np.full(1000, 0.975))
+    [norm_ppf(0.975) for _ in range(1000)]
+    info = cache_info()
+    assert (info.hits, info.misses) == (1000, 1), info
+
+    # thousands of distinct dof in one array bypass the cache
+    nu = rng.uniform(1, 100, 10000)
+    tic = time.perf_counter()
+    np.testing.assert_allclose(t_value(0.95, nu), stats.t.ppf(0.975, nu))
+    assert cache_info().misses == 1
+    print('%d distinct dof in %.3f s' % (nu.size, time.perf_counter() - tic))
+    np.testing.assert_allclose(norm_ppf([0.975, 0.5]), [1.959964, 0.0],
+                               atol=1e-6)
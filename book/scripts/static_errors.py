@@ -0,0 +1,196 @@
+""" Hysteresis, linearity, zero and sensitivity errors of cyclic calibrations
+
+calibration/hysteresis_error_analysis.ipynb (and hysteresis_example.py)
+computes e_h = y[:6] - np.flipud(y[6:]), i.e. exactly one up/down cycle of
+6 points, and the sensitivity K = dy/dx by hand. Here a calibration record
+of any number of cycles is split into its increasing and decreasing
+branches from the steps of x, every branch is interpolated onto common
+input levels and the branches of the same direction are averaged:
+
+    from static_errors import static_errors
+    r = static_errors(x, y)              # x (points,) or (runs, points)
+    r.hysteresis                         # y_up - y_down at r.levels
+    100*r.e_h/r.fso                      # max |e_h| in % FSO
+
+Thousands of runs are the rows of y (and of x) and are analyzed together.
+Against the least squares line y = m x + b of every run (batch_calibration)
+
+    linearity   : mean of the branches - (m x + b) at the levels
+    zero        : b - intercept of the ideal line
+    sensitivity : 100 (m - slope)/slope [%] of the ideal line
+    K, logK     : dy/dx and dlog y/dlog x of the mean branch between levels
+
+The turning points belong to both branches they join.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from batch_calibration import fit_calibration
+
+StaticErrors = namedtuple(
+    'StaticErrors',
+    ['levels', 'up', 'down', 'hysteresis', 'linearity', 'K', 'logK', 'm',
+     'b', 'zero', 'sensitivity', 'e_h', 'e_l', 'fso'])
+StaticErrors.__doc__ = """ per run (rows) and input level (columns): mean
+output of the increasing and decreasing branches (NaN where a branch does
+not reach the level), hysteresis, linearity and the sensitivities; per
+run: the fitted m, b, zero and sensitivity [%] errors, the largest
+|hysteresis| e_h and |linearity| e_l, and the full scale output fso """
+
+
+def branches(x, y, levels, chunk=1024):
+    """ mean output of the increasing and decreasing branches at levels
+
+    Every step x[i] -> x[i+1] is a linear piece of a branch. A piece
+    covers the levels in [min, max) of its ends, and also its top end
+    when the branch turns there, so that every pass of a branch counts
+    once at every level it reaches. The levels of every piece are found
+    by searchsorted, only the (piece, level) pairs that exist are
+    interpolated, about passes x levels per run.
+
+    Returns:
+        up, down : (runs, levels), NaN where no branch reaches the level
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    levels = np.asarray(levels, dtype=float)
+    order = np.argsort(levels)
+    L = levels[order]
+    n = L.size
+    up = np.empty(y.shape[:1] + L.shape)
+    down = np.empty_like(up)
+    for i in range(0, y.shape[0], chunk):
+        xx, yy = x[i:i + chunk], y[i:i + chunk]
+        runs = xx.shape[0]
+        dx, dy = np.diff(xx, axis=-1), np.diff(yy, axis=-1)
+        d = np.sign(dx)
+        # the top end of a rising piece is its second point, of a falling
+        # piece its first one: open when the branch continues beyond it
+        open_top = np.zeros(d.shape, dtype=bool)
+        open_top[:, :-1] = (d[:, :-1] > 0) & (d[:, 1:] > 0)
+        open_top[:, 1:] |= (d[:, 1:] < 0) & (d[:, :-1] < 0)
+        lo = np.minimum(xx[:, :-1], xx[:, 1:])
+        hi = np.maximum(xx[:, :-1], xx[:, 1:])
+        first = np.searchsorted(L, lo, 'left')
+        last = np.where(open_top, np.searchsorted(L, hi, 'left'),
+                        np.searchsorted(L, hi, 'right'))
+        count = np.where(d != 0, np.maximum(last - first, 0), 0).ravel()
+
+        # one entry per covered (piece, level)
+        piece = np.repeat(np.arange(count.size), count)
+        k = first.ravel()[piece] + np.arange(piece.size) - np.repeat(
+            np.cumsum(count) - count, count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (dy/dx).ravel()
+        value = yy[:, :-1].ravel()[piece] + (L[k] - xx[:, :-1].ravel()[
+            piece])*slope[piece]
+        run = piece//d.shape[1]
+        falling = d.ravel()[piece] < 0
+        bins = (2*run + falling)*n + k
+        total = np.bincount(bins, value, minlength=2*runs*n)
+        passes = np.bincount(bins, minlength=2*runs*n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = (total/passes).reshape(runs, 2, n)
+        up[i:i + chunk, order] = mean[:, 0]
+        down[i:i + chunk, order] = mean[:, 1]
+    return up, down
+
+
+def static_errors(x, y, levels=None, slope=1.0, intercept=0.0, chunk=1024):
+    """ static errors of calibration runs, see the module help
+
+    Inputs:
+        x : inputs (points,) shared by the runs, or (runs, points)
+        y : outputs (points,) of one run, or (runs, points)
+        levels : input levels of the branches, the distinct x by default
+        slope, intercept : the ideal line of the instrument
+        chunk : runs interpolated at once
+
+    Returns:
+        StaticErrors
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    x = np.asarray(x, dtype=float)
+    levels = np.unique(x) if levels is None else np.asarray(levels, float)
+    up, down = branches(x, y, levels, chunk)
+
+    # mean of the branches, either one where the other does not reach
+    n = (~np.isnan(up)).astype(float) + ~np.isnan(down)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (np.nan_to_num(up) + np.nan_to_num(down))/n
+        K = np.diff(mean, axis=-1)/np.diff(levels)
+        logK = np.diff(np.log(mean), axis=-1)/np.diff(np.log(levels))
+
+    fit = fit_calibration(x, y)
+    linearity = mean - (fit.m[:, None]*levels + fit.b[:, None])
+    hysteresis = up - down
+    # fmax skips the NaN of the levels a branch does not reach
+    e_h = np.fmax.reduce(np.abs(hysteresis), axis=-1)
+    e_l = np.fmax.reduce(np.abs(linearity), axis=-1)
+    fso = y.max(axis=-1) - y.min(axis=-1)
+    return StaticErrors(levels, up, down, hysteresis, linearity, K, logK,
+                        fit.m, fit.b, fit.b - intercept,
+                        100*(fit.m - slope)/slope, e_h, e_l, fso)
+
+
+if __name__ == '__main__':
+    import time
+
+    # hysteresis_error_analysis.ipynb: one cycle of 6 points
+    x = np.array([0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 5.0, 4.0, 3.0, 2.0, 1.0, 0.0])
+    y = np.array([0.1, 1.1, 2.1, 3.0, 4.1, 5.0, 5.0, 4.2, 3.2, 2.2, 1.2, 0.2])
+    r = static_errors(x, y)
+    np.testing.assert_allclose(r.hysteresis[0], y[:6] - np.flipud(y[6:]),
+                               atol=1e-12)
+    print('e_h =', r.hysteresis[0], '[mV], e_hmax = %.2f mV = %.2f%% FSO'
+          % (r.e_h[0], 100*r.e_h[0]/r.fso[0]))
+
+    # the sensitivity example: one increasing branch
+    x = np.array([0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0])
+    y = np.array([0.4, 1.0, 2.3, 6.9, 15.8, 36.4, 110.1, 253.2])
+    r = static_errors(x, y)
+    np.testing.assert_allclose(r.K[0], np.diff(y)/np.diff(x))
+    np.testing.assert_allclose(r.logK[0],
+                               np.diff(np.log(y))/np.diff(np.log(x)))
+    assert np.isnan(r.down).all() and np.isnan(r.e_h).all()
+    print('K =', np.round(r.K[0], 2), '\nlog K =', np.round(r.logK[0], 2))
+
+    # calibration_simulation.ipynb: 3 cycles of 11 points per half cycle,
+    # the ascending half offset by +h/2 and the descending one by -h/2
+    rng = np.random.default_rng(25)
+    runs = 10000
+    x_asc = np.linspace(-10, 10, 11)
+    cycle = np.concatenate([x_asc, x_asc[::-1][1:-1]])
+    ascending = np.r_[np.ones(11, bool), np.zeros(9, bool)]
+    x = np.tile(cycle, 3)
+    zero = rng.uniform(-0.5, 0.5, (runs, 1))
+    gain = rng.uniform(-5, 5, (runs, 1))
+    quadratic = rng.uniform(0, 0.01, (runs, 1))
+    h = rng.uniform(0, 1, (runs, 1))
+    y = (x + zero)*(1 + gain/100) + quadratic*x**2 + \
+        np.where(np.tile(ascending, 3), h/2, -h/2)
+    tic = time.perf_counter()
+    r = static_errors(x, y)
+    print('%d runs of %d points in %.2f s' % (runs, x.size,
+                                              time.perf_counter() - tic))
+    np.testing.assert_allclose(r.hysteresis[:, 1:-1], np.broadcast_to(
+        h, (runs, 9)), atol=1e-12)
+    np.testing.assert_allclose(r.e_h, h[:, 0], atol=1e-12)
+    np.testing.assert_allclose(r.sensitivity, gain[:, 0], atol=1e-9)
+    print('largest hysteresis %.3f, linearity %.3f, zero %.3f, sensitivity '
+          '%.2f%% in run 0' % (r.e_h[0], r.e_l[0], r.zero[0],
+                               r.sensitivity[0]))
+
+    # levels in any order
+    r2 = static_errors(x, y[:10], levels=r.levels[::-1])
+    np.testing.assert_allclose(r2.hysteresis, r.hysteresis[:10, ::-1])
+
+    # 2000 runs of 3 cycles with 101 levels
+    x_asc = np.linspace(0, 10, 101)
+    x = np.tile(np.concatenate([x_asc, x_asc[::-1][1:-1]]), 3)
+    y = x + rng.normal(0, 0.01, (2000, x.size))
+    tic = time.perf_counter()
+    r = static_errors(x, y)
+    print('2000 runs of %d points, 101 levels in %.2f s'
+          % (x.size, time.perf_counter() - tic))
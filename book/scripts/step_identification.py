@@ -0,0 +1,252 @@
+""" Batched identification of second order systems from step responses
+
+The log-decrement method of
+dynamic_signals/2nd_order_system_step_function_log_decrement.ipynb for a
+whole stack of step-response records, one record per row:
+
+1. static sensitivity K from the settled end of every record
+2. positive peaks of q_o/(K q_is) - 1 for all records at once (local maxima,
+   refined by a parabola through the three samples around each of them)
+3. the peaks decay as e^{-zeta wn t} and are one damped period T apart:
+   a least squares line through (t*, ln y*) gives sigma = zeta wn, and
+   wd = 2 pi/T, so that  wn = sqrt(sigma^2 + wd^2),  zeta = sigma/wn,
+   the same as zeta = delta/sqrt((2 pi)^2 + delta^2) with delta = sigma T
+4. Levenberg-Marquardt refinement of (K, wn, zeta) of all the records
+   together, on the closed form step response of dynamic_response.py
+
+    from step_identification import identify
+    fit = identify(t, Y)            # Y of shape (records, samples)
+    fit.K, fit.wn, fit.zeta
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dynamic_response import _decay_terms, second_order_step
+
+StepFit = namedtuple('StepFit', ['K', 'wn', 'zeta', 'peaks', 'rms'])
+StepFit.__doc__ = """ per record static sensitivity K, natural frequency wn
+[rad/s], damping ratio zeta, number of peaks used and rms residual """
+
+
+def log_decrement(t, Y, q_is=1.0, settle=0.1, threshold=0.01):
+    """ steps 1-3: K, wn, zeta of every row of Y from its peaks
+
+    Inputs:
+        t : (samples,) time from the step [s], uniformly spaced
+        Y : (records, samples) outputs
+        settle : fraction of the record at the end used for K and for the
+            noise level
+        threshold : smallest relative peak height that is used, raised to
+            5 times the noise of the settled part
+
+    Returns:
+        K, wn, zeta, number of peaks; with a single peak zeta and wn come
+        from the overshoot and the time of the peak, records without peaks
+        (over-damped) get zeta = 1 and wn from the time to reach 1 - 3/e^2
+    """
+    t = np.asarray(t, dtype=float)
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    rows, size = Y.shape
+    dt = t[1] - t[0]
+    tail = max(2, int(settle*size))
+    K = Y[:, -tail:].mean(axis=1)/q_is
+    r = Y/(K[:, None]*q_is) - 1
+    thr = np.maximum(threshold, 5*r[:, -tail:].std(axis=1))
+
+    # every positive excursion (lobe) of r holds one peak, the lobes are
+    # numbered by the upward zero crossings and their maxima found at once
+    pos = r > 0
+    lobe = np.cumsum(np.c_[pos[:, :1], pos[:, 1:] & ~pos[:, :-1]], axis=1)
+    L = lobe.max() + 1
+    key = (np.arange(rows)[:, None]*L + lobe)[pos]
+    height = np.full(rows*L, -np.inf)
+    np.maximum.at(height, key, r[pos])
+    height = height.reshape(rows, L)
+    at = np.zeros(rows*L, dtype=int)
+    top = pos & (r == height[np.arange(rows)[:, None], lobe])
+    at[key[top[pos]]] = np.nonzero(top)[1]
+    at = at.reshape(rows, L)
+    peak = height > thr[:, None]
+
+    # parabolic refinement of position and height of every peak
+    i = np.clip(at, 1, size - 2)
+    left, mid, right = (np.take_along_axis(r, i + k, axis=1)
+                        for k in (-1, 0, 1))
+    curv = left - 2*mid + right
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift = np.where(peak & (curv < 0), 0.5*(left - right)/curv, 0.0)
+    tp = t[i] + shift*dt
+    yp = np.where(peak, mid - 0.25*(left - right)*shift, 1.0)
+
+    # least squares line ln(y*) = c - sigma t* over the peaks of each row
+    w = peak.astype(float)
+    n = w.sum(axis=1)
+    ly = np.log(np.maximum(yp, 1e-300))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mt = (w*tp).sum(axis=1)/n
+        ml = (w*ly).sum(axis=1)/n
+        dtp = (tp - mt[:, None])*w
+        Stt = (dtp**2).sum(axis=1)
+        sigma = -(dtp*(ly - ml[:, None])).sum(axis=1)/Stt
+        # period from the line t* = t0 + T k through the peak numbers k
+        k = np.cumsum(peak, axis=1)
+        mk = (w*k).sum(axis=1)/n
+        T = Stt/(dtp*(k - mk[:, None])).sum(axis=1)
+        wn = np.sqrt(sigma**2 + (2*np.pi/T)**2)
+    zeta = sigma/wn
+
+    # one peak: overshoot M = e^{-pi zeta/sqrt(1-zeta^2)} at t* = pi/wd
+    one = n == 1
+    if one.any():
+        j = np.argmax(peak[one], axis=1)
+        lnM = np.log(yp[one, j])
+        zeta[one] = -lnM/np.sqrt(np.pi**2 + lnM**2)
+        wn[one] = np.pi/(tp[one, j]*np.sqrt(1 - zeta[one]**2))
+
+    # over-damped: with zeta = 1, q_o/K = 1 - 3/e^2 at wn t = 2
+    few = n == 0
+    if few.any():
+        reach = np.argmax(r[few] > -3*np.exp(-2.0), axis=1)
+        wn[few] = 2.0/np.maximum(t[reach], dt)
+        zeta[few] = 1.0
+    return K, wn, zeta, n.astype(int)
+
+
+def _jacobian(t, K, wn, zeta, c, d, q_is):
+    """ dq_o/d(K, wn, zeta) of the step response from its decay terms """
+    x = wn*t
+    one = 1 - zeta**2
+    near = np.abs(one) < 1e-6
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dz = (x*c - d)/np.where(near, 1.0, one)
+    if near.any():
+        # the limit of (x c - d)/(1 - zeta^2) at critical damping
+        dz = np.where(near, -x**3*np.exp(-zeta*x)/3, dz)
+    J = np.empty(c.shape + (3,))
+    J[..., 0] = q_is*(1 - c - zeta*d)
+    J[..., 1] = K*q_is*t*d
+    J[..., 2] = K*q_is*dz
+    return J
+
+
+def refine(t, Y, K, wn, zeta, q_is=1.0, iterations=20):
+    """ step 4: batched Levenberg-Marquardt on the analytic step response
+
+    With c and d of _decay_terms and x = wn t, q_o = K q_is (1 - c - zeta d)
+    and its derivatives are in closed form:
+
+        dq_o/dK = q_o/K,  dq_o/dwn = K q_is t d,
+        dq_o/dzeta = K q_is (x c - d)/(1 - zeta^2)
+
+    so every iteration evaluates the decay terms once. Records that have
+    converged are left out of the following iterations.
+    """
+    t = np.asarray(t, dtype=float)
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    p = np.stack([K, wn, zeta], axis=1).astype(float)
+    lam = np.full(len(p), 1e-3)
+
+    c, d = _decay_terms(t, p[:, 1:2], p[:, 2:3])
+    y = p[:, :1]*q_is*(1 - c - p[:, 2:3]*d)
+    sse = np.sum((Y - y)**2, axis=1)
+    active = np.arange(len(p))
+    for _ in range(iterations):
+        pa = p[active]
+        J = _jacobian(t, pa[:, :1], pa[:, 1:2], pa[:, 2:3], c[active],
+                      d[active], q_is)
+        Jt = J.transpose(0, 2, 1)
+        JtJ = Jt @ J
+        g = (Jt @ (Y[active] - y[active])[..., None])[..., 0]
+        A = JtJ + lam[active, None, None]*JtJ*np.eye(3)
+        p_new = pa + np.linalg.solve(A, g[..., None])[..., 0]
+        p_new[:, 1:] = np.maximum(p_new[:, 1:], 1e-9)
+
+        c_new, d_new = _decay_terms(t, p_new[:, 1:2], p_new[:, 2:3])
+        y_new = p_new[:, :1]*q_is*(1 - c_new - p_new[:, 2:3]*d_new)
+        sse_new = np.sum((Y[active] - y_new)**2, axis=1)
+        sse_old = sse[active]
+        better = sse_new <= sse_old
+        # a record is done when a step no longer lowers its residual
+        # noticeably or when lambda has grown beyond any useful step
+        done = np.where(better, sse_old - sse_new <= 1e-10*sse_old,
+                        lam[active] > 1e8)
+        rows = active[better]
+        p[rows], y[rows], sse[rows] = (p_new[better], y_new[better],
+                                       sse_new[better])
+        c[rows], d[rows] = c_new[better], d_new[better]
+        lam[active] = np.where(better, lam[active]/10, lam[active]*10)
+        active = active[~done]
+        if active.size == 0:
+            break
+
+    return p[:, 0], p[:, 1], p[:, 2], np.sqrt(sse/Y.shape[1])
+
+
+def _identify(args):
+    t, Y, q_is = args
+    K, wn, zeta, n = log_decrement(t, Y, q_is)
+    K, wn, zeta, rms = refine(t, Y, K, wn, zeta, q_is)
+    return StepFit(K, wn, zeta, n, rms)
+
+
+def identify(t, Y, q_is=1.0, workers=None, batch=1000):
+    """ K, wn, zeta of every record (row) of Y, see the module help
+
+    Large stacks are cut into batches of rows, with workers > 1 the
+    batches are processed in a process pool
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    jobs = [(t, Y[i:i + batch], q_is) for i in range(0, len(Y), batch)]
+    if workers and workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_identify, jobs))
+    else:
+        parts = [_identify(job) for job in jobs]
+    return StepFit(*[np.concatenate(f) for f in zip(*parts)])
+
+
+if __name__ == '__main__':
+    import time
+
+    # the notebook transducer, sampled as ts = t[::15]
+    wn, z = 546.72, 0.2
+    t = np.linspace(0, 0.1, 67)
+    K, wn_ld, zeta_ld, n = log_decrement(t, second_order_step(t, 1, wn, z))
+    print('log decrement: wn = %.2f, zeta = %.3f from %d peaks'
+          % (wn_ld[0], zeta_ld[0], n[0]))
+
+    # a production batch of noisy pressure transducers
+    rng = np.random.default_rng(8)
+    records = 5000
+    K_true = rng.normal(1.0, 0.05, records)
+    wn_true = rng.uniform(400, 700, records)
+    zeta_true = rng.uniform(0.1, 0.6, records)
+    t = np.linspace(0, 0.06, 600)
+    Y = second_order_step(t, K_true[:, None], wn_true[:, None],
+                          zeta_true[:, None])
+    Y += rng.normal(0, 0.005, Y.shape)
+
+    # against a loop of curve_fit from the same starting points
+    from scipy.optimize import curve_fit
+    part = slice(0, 500)
+    start = log_decrement(t, Y[part])[:3]
+    tic = time.perf_counter()
+    loop = np.array([curve_fit(second_order_step, t, y, p0)[0]
+                     for y, p0 in zip(Y[part], np.transpose(start))])
+    t_loop = time.perf_counter() - tic
+    tic = time.perf_counter()
+    batch = np.transpose(refine(t, Y[part], *start)[:3])
+    t_batch = time.perf_counter() - tic
+    np.testing.assert_allclose(batch, loop, rtol=1e-5)
+    print('refine 500 records: %.2f s, curve_fit loop: %.2f s'
+          % (t_batch, t_loop))
+
+    tic = time.perf_counter()
+    fit = identify(t, Y)
+    print('%d records in %.2f s' % (records, time.perf_counter() - tic))
+    print('max relative error: K %.1e, wn %.1e, zeta %.1e'
+          % tuple(np.max(np.abs(a/b - 1)) for a, b in
+                  [(fit.K, K_true), (fit.wn, wn_true),
+                   (fit.zeta, zeta_true)]))
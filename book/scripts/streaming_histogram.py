@@ -0,0 +1,279 @@
+""" Fixed memory histogram and probability density of an endless record
+
+statistics/histogram_to_distribution.ipynb and histogram_exercise.py call
+hist() on the whole thermocouples.dat array once per number of bins and
+normalize the counts by hand. StreamingHistogram does the same for data
+that arrive in chunks and is never kept:
+
+    h = StreamingHistogram()
+    for chunk in log:
+        h.update(chunk)
+    J = h.bin_count('sturges')             # 1 + 3.3 log10 N
+    counts, edges = h.histogram(J)
+    x, f = h.pdf(J)                        # area normalized
+    z, p = h.pdf(J, standardized=True)     # (x - mean)/std
+    h.mean, h.std, h.skewness, h.kurtosis
+
+The data are counted in `size` fine bins of width base*2^m on a fixed
+lattice. When a value falls outside of the covered range the width is
+doubled (pairs of bins are added), so the memory never grows and the
+counts stay exact. Any number of coarse bins is interpolated from the
+cumulative fine counts, with an error of at most one fine bin at each
+edge. Two histograms with the same size and base, e.g. of two loggers or
+of two workers, are merged exactly with merge(). The moments are updated
+with the pairwise formulas of Chan and Pebay, so they do not suffer from
+the cancellation of sums of powers.
+"""
+import numpy as np
+
+RULES = {
+    'sturges': lambda N: 1 + 3.3*np.log10(N),
+    'rice': lambda N: 2*N**(1/3.),
+    'sqrt': lambda N: np.sqrt(N),
+}
+
+
+def _moments(x):
+    """ count, mean and the central sums M2, M3, M4 of a chunk """
+    m = x.mean()
+    d = x - m
+    d2 = d*d
+    return x.size, m, d2.sum(), (d2*d).sum(), (d2*d2).sum()
+
+
+def _combine(a, b):
+    """ moments of the union of two samples (Pebay, 2008) """
+    na, ma, M2a, M3a, M4a = a
+    nb, mb, M2b, M3b, M4b = b
+    if na == 0:
+        return b
+    if nb == 0:
+        return a
+    n = na + nb
+    d = mb - ma
+    dn = d/n
+    M2 = M2a + M2b + d*dn*na*nb
+    M3 = (M3a + M3b + d*dn*dn*na*nb*(na - nb)
+          + 3*dn*(na*M2b - nb*M2a))
+    M4 = (M4a + M4b + d*dn**3*na*nb*(na*na - na*nb + nb*nb)
+          + 6*dn*dn*(na*na*M2b + nb*nb*M2a) + 4*dn*(na*M3b - nb*M3a))
+    return n, ma + dn*nb, M2, M3, M4
+
+
+class StreamingHistogram:
+    """ histogram, moments and PDF of data given chunk by chunk
+
+    size : number of fine bins (even), the memory in use
+    base : the fine bin width is base*2^m, histograms with equal size and
+        base can be merged
+    """
+
+    def __init__(self, size=1024, base=1.0):
+        if size < 2 or size % 2:
+            raise ValueError('size must be an even number >= 2')
+        self.size = size
+        self.base = float(base)
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.m = None           # bin width is base*2^m
+        self.k0 = 0             # lattice index of the first bin
+        self.min, self.max = np.inf, -np.inf
+        self._moments = (0, 0.0, 0.0, 0.0, 0.0)
+
+    @property
+    def width(self):
+        return self.base*2.0**self.m
+
+    def _index(self, x):
+        return np.floor(np.asarray(x)/self.width).astype(np.int64)
+
+    def _coarsen(self):
+        """ double the bin width, adjacent pairs of bins are added """
+        k = self.k0 + np.arange(self.size)
+        k0 = self.k0 // 2
+        self.counts = np.bincount(k//2 - k0, weights=self.counts,
+                                  minlength=self.size).astype(np.int64)
+        self.k0 = k0
+        self.m += 1
+
+    def _cover(self, lo, hi):
+        """ coarsen and shift the bins until [lo, hi] is in their range """
+        if self.m is None:
+            span = (hi - lo) or abs(hi) or 1.0
+            self.m = int(np.floor(np.log2(span/(self.size*self.base))))
+            self.k0 = int(self._index(lo))
+        lo, hi = min(lo, self.min), max(hi, self.max)
+        while self._index(hi) - self._index(lo) >= self.size:
+            self._coarsen()
+        klo, khi = int(self._index(lo)), int(self._index(hi))
+        if klo < self.k0 or khi >= self.k0 + self.size:
+            k0 = min(max(self.k0, khi - self.size + 1), klo)
+            self.counts = np.roll(self.counts, self.k0 - k0)
+            self.k0 = k0
+
+    def update(self, x):
+        """ add a chunk of samples, NaN and inf are skipped """
+        x = np.asarray(x, dtype=float).ravel()
+        x = x[np.isfinite(x)]
+        if x.size == 0:
+            return self
+        lo, hi = x.min(), x.max()
+        self._cover(lo, hi)
+        self.counts += np.bincount(self._index(x) - self.k0,
+                                   minlength=self.size)
+        self.min, self.max = min(self.min, lo), max(self.max, hi)
+        self._moments = _combine(self._moments, _moments(x))
+        return self
+
+    def _lattice(self, counts, k0, m, k0_new, m_new):
+        """ occupied bins of counts (lattice k0, width 2^m) as indices and
+        counts on the coarser lattice k0_new, width 2^m_new """
+        i = np.flatnonzero(counts)
+        return ((k0 + i) >> (m_new - m)) - k0_new, counts[i]
+
+    def merge(self, other):
+        """ add the data of another histogram of the same size and base """
+        if (other.size, other.base) != (self.size, self.base):
+            raise ValueError('histograms of different size or base')
+        if other.n == 0:
+            return self
+        if self.m is None:
+            self.m, self.k0 = other.m, other.k0
+        # the common lattice that covers both ranges, then both counts
+        # are brought onto it
+        lo, hi = min(self.min, other.min), max(self.max, other.max)
+        m = max(self.m, other.m)
+        width = self.base*2.0**m
+        while np.floor(hi/width) - np.floor(lo/width) >= self.size:
+            m += 1
+            width *= 2
+        klo, khi = int(np.floor(lo/width)), int(np.floor(hi/width))
+        k0 = min(max(self.k0 >> (m - self.m), khi - self.size + 1), klo)
+        i, c = self._lattice(self.counts, self.k0, self.m, k0, m)
+        j, d = self._lattice(other.counts, other.k0, other.m, k0, m)
+        self.counts = np.bincount(np.r_[i, j], weights=np.r_[c, d],
+                                  minlength=self.size).astype(np.int64)
+        self.m, self.k0 = m, k0
+        self.min, self.max = lo, hi
+        self._moments = _combine(self._moments, other._moments)
+        return self
+
+    @property
+    def n(self):
+        return self._moments[0]
+
+    @property
+    def mean(self):
+        return self._moments[1]
+
+    @property
+    def var(self):
+        """ population variance, as np.var """
+        return self._moments[2]/self.n
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def skewness(self):
+        """ as scipy.stats.skew(x) """
+        n, _, M2, M3, _ = self._moments
+        return np.sqrt(n)*M3/M2**1.5
+
+    @property
+    def kurtosis(self):
+        """ excess kurtosis, as scipy.stats.kurtosis(x) """
+        n, _, M2, _, M4 = self._moments
+        return n*M4/M2**2 - 3
+
+    def bin_count(self, rule='sturges'):
+        """ number of bins by a rule of thumb of the notebook:
+        'sturges' 1 + 3.3 log10 N, 'rice' 2 N^(1/3) or 'sqrt', rounded up """
+        return int(np.ceil(RULES[rule](self.n)))
+
+    def histogram(self, bins='sturges', range=None):
+        """ counts and edges of equal bins between min and max (or range)
+
+        bins : number of bins or the name of a rule, see bin_count()
+        """
+        if isinstance(bins, str):
+            bins = self.bin_count(bins)
+        lo, hi = (self.min, self.max) if range is None else range
+        edges = np.linspace(lo, hi, bins + 1)
+        # the data are within [min, max], also in the outermost fine bins
+        fine = np.clip(self.width*(self.k0 + np.arange(self.size + 1)),
+                       self.min, self.max)
+        cdf = np.r_[0, np.cumsum(self.counts)]
+        counts = np.diff(np.interp(edges, fine, cdf))
+        return counts, edges
+
+    def pdf(self, bins='sturges', standardized=False):
+        """ bin centres and probability density (area normalized)
+
+        with standardized=True the centres are (x - mean)/std and the density
+        is scaled by std, so that it can be compared with N(0, 1)
+        """
+        counts, edges = self.histogram(bins)
+        x = 0.5*(edges[1:] + edges[:-1])
+        f = counts/(self.n*np.diff(edges))
+        if standardized:
+            return (x - self.mean)/self.std, f*self.std
+        return x, f
+
+
+if __name__ == '__main__':
+    import os
+    import time
+    from scipy import stats
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'data', 'thermocouples.dat')
+    T = np.loadtxt(path, skiprows=1)[:, 1]
+
+    h = StreamingHistogram()
+    for chunk in np.array_split(T, 7):
+        h.update(chunk)
+    print('N = %d, bins: sturges %d, rice %d' % (h.n, h.bin_count('sturges'),
+                                                h.bin_count('rice')))
+    for J in (11, 15, 19):
+        counts, edges = h.histogram(J)
+        n_ref, _ = np.histogram(T, J)
+        print('%d bins, largest count difference to hist(): %.1f of %d'
+              % (J, np.max(np.abs(counts - n_ref)), n_ref.max()))
+    print('T skewness = %f, kurtosis = %f' % (h.skewness, h.kurtosis))
+    np.testing.assert_allclose([h.mean, h.std, h.skewness, h.kurtosis],
+                               [T.mean(), T.std(), stats.skew(T),
+                                stats.kurtosis(T)])
+    x, f = h.pdf(15)
+    edges = h.histogram(15)[1]
+    print('Area under the curve = %f' % np.sum(f*np.diff(edges)))
+
+    # two loggers, merged afterwards, equal one logger of the union
+    rng = np.random.default_rng(14)
+    x1, x2 = rng.normal(25, 1, 10**5), rng.normal(40, 3, 10**5)
+    a = StreamingHistogram(256).update(x1)
+    b = StreamingHistogram(256).update(x2)
+    both = StreamingHistogram(256).update(np.r_[x1, x2])
+    a.merge(b)
+    np.testing.assert_array_equal(a.histogram(50)[0], both.histogram(50)[0])
+    np.testing.assert_allclose([a.mean, a.std, a.skewness, a.kurtosis],
+                               [both.mean, both.std, both.skewness,
+                                both.kurtosis])
+
+    # loggers with ranges far apart, in both orders
+    x3 = rng.normal(100, 1, 1000)
+    for u, v in ((x1, x3), (x3, x1)):
+        a = StreamingHistogram(256).update(u)
+        a.merge(StreamingHistogram(256).update(v))
+        both = StreamingHistogram(256).update(np.r_[u, v])
+        assert a.counts.sum() == a.n == u.size + v.size
+        np.testing.assert_array_equal(a.histogram(50)[0],
+                                      both.histogram(50)[0])
+
+    # a day of 1 kHz data in chunks of 10 s, in 8 kB of counts
+    h = StreamingHistogram()
+    tic = time.perf_counter()
+    for i in range(86400//10):
+        h.update(rng.normal(30 + 1e-4*i, 0.5, 10000))
+    print('%d samples in %.2f s, bin width %.4f C, mean %.2f C'
+          % (h.n, time.perf_counter() - tic, h.width, h.mean))
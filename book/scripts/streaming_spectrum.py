@@ -0,0 +1,141 @@
+""" Streaming Welch power spectrum of long records
+
+powerspectrum(x) in dynamic_signals/load_plot_spectrum_turbulent_data_jet.ipynb
+takes one FFT of the whole record, which needs the record in memory and
+gives a very noisy estimate. Here the record is read chunk by chunk, cut
+into overlapping windowed segments and the periodograms of the segments
+are averaged (Welch, or Bartlett with noverlap=0). Memory is constant: one
+chunk, the overlap carried between chunks and the running sum of the
+spectra.
+
+    acc = WelchAccumulator(fs, nperseg=4096)
+    for chunk in chunks:
+        acc.update(chunk)
+    f, psd = acc.result()
+
+or with a numpy array, np.memmap or any iterable of chunks:
+
+    for f, psd, nseg in streaming_welch(np.load('u.npy', mmap_mode='r'),
+                                        fs, every=100):
+        ...
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import get_window
+
+
+class WelchAccumulator:
+    """ running average of windowed, overlapping segment periodograms
+
+    The result is the one-sided power spectral density [units^2/Hz],
+    the same scaling as scipy.signal.welch(..., scaling='density')
+    """
+
+    def __init__(self, fs, nperseg=4096, noverlap=None, window='hann',
+                 detrend=True):
+        self.fs = fs
+        self.nperseg = nperseg
+        self.noverlap = nperseg//2 if noverlap is None else noverlap
+        self.step = nperseg - self.noverlap
+        if self.step < 1:
+            raise ValueError('noverlap must be smaller than nperseg')
+        self.window = get_window(window, nperseg)
+        self.detrend = detrend
+        self.f = np.fft.rfftfreq(nperseg, 1./fs)
+        self.nseg = 0
+        self.nsamples = 0
+        self._sum = np.zeros(self.f.size)
+        self._tail = np.empty(0)
+
+    def update(self, chunk):
+        """ add the next piece of the record """
+        chunk = np.asarray(chunk, dtype=float).ravel()
+        self.nsamples += chunk.size
+        buf = np.concatenate((self._tail, chunk))
+        if buf.size < self.nperseg:
+            self._tail = buf
+            return self
+
+        segments = sliding_window_view(buf, self.nperseg)[::self.step]
+        if self.detrend:
+            segments = segments - segments.mean(axis=1, keepdims=True)
+        X = np.fft.rfft(segments*self.window, axis=1)
+        self._sum += np.sum(X.real**2 + X.imag**2, axis=0)
+        n = segments.shape[0]
+        self.nseg += n
+        # keep what the next segment needs, including the overlap
+        self._tail = buf[n*self.step:].copy()
+        return self
+
+    def result(self):
+        """ frequencies and the averaged PSD of the segments seen so far """
+        if self.nseg == 0:
+            raise ValueError('the record is shorter than one segment')
+        psd = self._sum/(self.nseg*self.fs*np.sum(self.window**2))
+        # one-sided: double everything except DC and Nyquist
+        if self.nperseg % 2 == 0:
+            psd[1:-1] *= 2
+        else:
+            psd[1:] *= 2
+        return self.f, psd
+
+
+def iter_chunks(source, chunk_size=2**20):
+    """ chunks of an array (also np.memmap) or of any iterable of chunks """
+    if hasattr(source, 'shape') and hasattr(source, '__getitem__'):
+        for start in range(0, source.shape[0], chunk_size):
+            yield np.asarray(source[start:start + chunk_size])
+    else:
+        yield from source
+
+
+def streaming_welch(source, fs, nperseg=4096, noverlap=None, window='hann',
+                    chunk_size=2**20, every=None, progress=None):
+    """ generator of (f, psd, nseg), converging Welch spectra
+
+    Inputs:
+        source : array, np.memmap or iterable of chunks
+        fs : sampling frequency [Hz]
+        nperseg, noverlap, window : segments as in scipy.signal.welch
+        chunk_size : samples read at once from an array source
+        every : yield an intermediate spectrum every so many chunks,
+            None yields only the final one
+        progress : callable(nsamples, nseg) called after every chunk
+
+    The last item is always the spectrum of the whole record
+    """
+    acc = WelchAccumulator(fs, nperseg, noverlap, window)
+    for i, chunk in enumerate(iter_chunks(source, chunk_size), 1):
+        acc.update(chunk)
+        if progress is not None:
+            progress(acc.nsamples, acc.nseg)
+        if every and i % every == 0 and acc.nseg:
+            yield acc.result() + (acc.nseg,)
+    yield acc.result() + (acc.nseg,)
+
+
+if __name__ == '__main__':
+    from scipy import signal
+
+    fs = 1000.0
+    rng = np.random.default_rng(4)
+    x = np.sin(2*np.pi*50*np.arange(200_000)/fs) + rng.normal(0, 1, 200_000)
+
+    f_ref, psd_ref = signal.welch(x, fs, nperseg=1024)
+    for f, psd, nseg in streaming_welch(x, fs, nperseg=1024, chunk_size=7777,
+                                        every=10):
+        print('%d segments, peak at %.1f Hz' % (nseg, f[np.argmax(psd)]))
+    np.testing.assert_allclose(psd, psd_ref, rtol=1e-10)
+
+    # an endless source read through a generator, constant memory
+    def record(n_chunks, n=100_000):
+        for _ in range(n_chunks):
+            yield rng.normal(0, 1, n)
+
+    def report(nsamples, nseg):
+        if nseg % 5000 < 100:
+            print('%.1e samples, %d segments' % (nsamples, nseg))
+
+    *_, (f, psd, nseg) = streaming_welch(record(100), fs, nperseg=2048,
+                                         progress=report)
+    print('white noise PSD = %.4f, expected %.4f' % (psd[1:-1].mean(), 2/fs))
@@ -0,0 +1,159 @@
+""" Multi-tone test signals written into reusable buffers
+
+create_signal() of signal_processing.py builds one whole record with new
+arrays on every call, its tones come from tones() below. For load tests of
+a processing chain at high rates the signal
+
+    y(t) = DC + sum_i a_i sin(2 pi f_i t + phi_i) + noise
+
+is produced here without temporary arrays of the record length:
+
+    from synthesizer import Synthesizer, tones
+    y = tones(t, a, f)                      # any t, one outer product
+    syn = Synthesizer(fs, a, f, noise=0.1, seed=1)
+    buf = np.empty(4096)
+    for block in syn.blocks(buf):           # endless, phase continuous
+        process(block)                      # block is buf, refilled
+
+Uniformly sampled tones are computed by rotation instead of sin(): with a
+table r_j = e^{i w j/fs} of one block and the phasor c = a e^{i(w t0 +
+phi)} of the block start, every sample is
+
+    y[t0 + j/fs] = sum_i Im(r_ij c_i) = Re(r) @ Im(c) + Im(r) @ Re(c)
+
+i.e. two matrix-vector products per block. The phasor is computed from
+the sample counter at every block, so the error does not grow with the
+length of the stream. Noise comes from a np.random.Generator and is
+drawn into a scratch buffer.
+"""
+import numpy as np
+
+
+def tones(t, amplitudes, frequencies, phases=0.0, out=None, chunk=2**16):
+    """ sum of a sin(2 pi f t + phi) at arbitrary times t
+
+    All the tones of a chunk of t are one broadcasted outer product, the
+    sum over the tones is a matrix-vector product. The result is written
+    to out (a new array when None)
+    """
+    t = np.asarray(t, dtype=float)
+    a = np.atleast_1d(np.asarray(amplitudes, dtype=float))
+    w = 2*np.pi*np.atleast_1d(np.asarray(frequencies, dtype=float))
+    phi = np.broadcast_to(np.asarray(phases, dtype=float), a.shape)
+    out = np.empty(t.shape) if out is None else out
+    flat_t, flat_out = t.reshape(-1), out.reshape(-1)
+    for i in range(0, flat_t.size, chunk):
+        arg = np.multiply.outer(flat_t[i:i + chunk], w)
+        arg += phi
+        np.dot(np.sin(arg, out=arg), a, out=flat_out[i:i + chunk])
+    return out
+
+
+class Synthesizer:
+    """ endless, phase continuous multi-tone signal with Gaussian noise
+
+    fs : sampling frequency [Hz]
+    amplitudes, frequencies, phases : of the tones
+    dc : offset
+    noise : standard deviation of the white Gaussian noise
+    rng, seed : np.random.Generator, or the seed of a new one
+    """
+
+    def __init__(self, fs, amplitudes, frequencies, phases=0.0, dc=0.0,
+                 noise=0.0, rng=None, seed=None):
+        self.fs = float(fs)
+        self.a = np.atleast_1d(np.asarray(amplitudes, dtype=float))
+        self.f = np.atleast_1d(np.asarray(frequencies, dtype=float))
+        self.phi = np.broadcast_to(np.asarray(phases, dtype=float),
+                                   self.a.shape)
+        self.dc = dc
+        self.noise = noise
+        self.rng = np.random.default_rng(seed) if rng is None else rng
+        self.n = 0              # samples produced so far
+        self._cos = self._sin = np.empty((0, self.a.size))
+        self._scratch = np.empty(0)
+
+    def _rotation(self, size):
+        """ Re and Im of the table r, contiguous for fast products """
+        if self._cos.shape[0] < size:
+            wj = 2*np.pi*self.f*np.arange(size)[:, None]/self.fs
+            self._cos, self._sin = np.cos(wj), np.sin(wj)
+        return self._cos[:size], self._sin[:size]
+
+    def fill(self, out):
+        """ write the next out.size samples into out and return it """
+        size = out.size
+        cos, sin = self._rotation(size)
+        # phase of the block start from the counter, reduced modulo one
+        # period so that it stays accurate for an endless stream
+        start = 2*np.pi*np.mod(self.f*self.n, self.fs)/self.fs + self.phi
+        c = self.a*np.exp(1j*start)
+        np.dot(cos, c.imag, out=out)
+        out += sin @ c.real
+        if self.dc:
+            out += self.dc
+        if self.noise:
+            if self._scratch.size < size:
+                self._scratch = np.empty(size)
+            scratch = self._scratch[:size]
+            self.rng.standard_normal(out=scratch)
+            scratch *= self.noise
+            out += scratch
+        self.n += size
+        return out
+
+    def time(self, size):
+        """ times of the next `size` samples """
+        return (self.n + np.arange(size))/self.fs
+
+    def blocks(self, out=None, size=4096, count=None):
+        """ yield `count` (endless when None) consecutive blocks
+
+        Every block is written into the same buffer out (of `size` samples
+        when None), copy a block to keep it
+        """
+        out = np.empty(size) if out is None else out
+        i = 0
+        while count is None or i < count:
+            yield self.fill(out)
+            i += 1
+
+
+if __name__ == '__main__':
+    import time
+    from fractions import Fraction
+
+    fs, a, f, phi = 1000., [1., 1.5], [10.0, 35.7], [0.3, 1.1]
+    t = np.arange(10**5)/fs
+    reference = sum(aa*np.sin(2*np.pi*ff*t + p)
+                    for aa, ff, p in zip(a, f, phi))
+    np.testing.assert_allclose(tones(t, a, f, phi), reference, atol=1e-12)
+
+    # blocks of any size continue the phase
+    syn = Synthesizer(fs, a, f, phi)
+    y = np.concatenate([syn.fill(np.empty(n)).copy()
+                        for n in (1, 1000, 4096, 17, 94886)])
+    np.testing.assert_allclose(y, reference, atol=1e-9)
+
+    # after 10^10 samples (four months at 1 kHz) the phase is still exact,
+    # the reference cycles f t mod 1 are computed with exact fractions
+    syn.n = 10**10
+    cycles = [[float(Fraction(str(ff))*(syn.n + j)/1000 % 1)
+               for j in range(1000)] for ff in f]
+    np.testing.assert_allclose(syn.fill(np.empty(1000)), sum(
+        aa*np.sin(2*np.pi*np.array(c) + p)
+        for aa, c, p in zip(a, cycles, phi)), atol=1e-9)
+
+    # 64 tones with noise, 2 10^7 samples through one 64 kB buffer
+    rng = np.random.default_rng(17)
+    syn = Synthesizer(1e6, rng.uniform(0, 1, 64), rng.uniform(0, 5e5, 64),
+                      rng.uniform(0, 2*np.pi, 64), noise=0.1, rng=rng)
+    buf = np.empty(8192)
+    tic = time.perf_counter()
+    for block in syn.blocks(buf, count=2*10**7//buf.size):
+        pass
+    rate = syn.n/(time.perf_counter() - tic)
+    tic = time.perf_counter()
+    tones(np.arange(10**6)/1e6, syn.a, syn.f, syn.phi)
+    print('64 tones: %.1f Msamples/s by rotation, %.1f by sin()'
+          % (rate/1e6, 1/(time.perf_counter() - tic)))
@@ -0,0 +1,176 @@
+""" Type A/B uncertainty budgets of many instruments as arrays
+
+theory/surface_roughness_budget.ipynb keeps the sources in a dict, divides
+every stated value by its divisor in a loop, calls stats.t.ppf for the
+coverage factor and builds the table row by row;
+theory/hot-wire_uncertainty_budget.ipynb sums a dict of percentages. Here
+a budget is a (sources, instruments) array of stated values with the
+divisors, sensitivities and degrees of freedom as vectors (or arrays of
+the same shape), and all the budgets are evaluated at once:
+
+    u_i = c_i value_i/divisor_i
+    u_c = sqrt(sum u_i^2)
+    nu_eff = u_c^4/sum(u_i^4/nu_i)       Welch-Satterthwaite, nu_i = inf
+                                         for the Type B sources
+    k = t_{nu_eff, confidence},  U = k u_c
+
+    from uncertainty_budget import UncertaintyBudget, divisors
+    budget = UncertaintyBudget(names, values, divisors(distributions), dof)
+    r = budget.evaluate(0.95)            # r.uc, r.nu_eff, r.k, r.U
+    budget.export('budgets.csv', r)      # or .parquet, one write
+
+nu_eff is truncated to an integer (GUM G.4.1) and the coverage factors
+come from stat_tables.t_value.
+"""
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from stat_tables import t_value
+
+DIVISORS = {'normal': 1.0, 'normal-k2': 2.0, 'rectangular': np.sqrt(3),
+            'triangular': np.sqrt(6), 'u-shaped': np.sqrt(2)}
+
+BudgetSummary = namedtuple('BudgetSummary',
+                           ['uc', 'nu_eff', 'k', 'U', 'u', 'percent'])
+BudgetSummary.__doc__ = """ combined standard uncertainty, effective degrees
+of freedom, coverage factor and expanded uncertainty of every instrument,
+the standard uncertainties u (sources, instruments) and their share of
+uc^2 in percent """
+
+
+def divisors(distributions):
+    """ vector of divisors for distribution names, see DIVISORS """
+    return np.array([DIVISORS[d] for d in distributions])
+
+
+class UncertaintyBudget:
+    """ stated values of the sources (rows) for every instrument (columns)
+
+    sources : names of the sources
+    values : (sources, instruments) stated values, or (sources,)
+    divisor : divisors (sources,) or (sources, instruments), 1 for
+        standard uncertainties
+    dof : degrees of freedom, np.inf for Type B
+    sensitivity : sensitivity coefficients c_i
+    instruments : names of the columns, 0, 1, ... by default
+    """
+
+    def __init__(self, sources, values, divisor=1.0, dof=np.inf,
+                 sensitivity=1.0, instruments=None):
+        self.sources = list(sources)
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values[:, None]
+        S = len(self.sources)
+        self.values = values
+        self.divisor = self._column(divisor, S)
+        self.dof = self._column(dof, S)
+        self.sensitivity = self._column(sensitivity, S)
+        self.instruments = list(range(values.shape[1])) \
+            if instruments is None else list(instruments)
+
+    @staticmethod
+    def _column(x, S):
+        """ per source vectors become (sources, 1) to broadcast """
+        x = np.asarray(x, dtype=float)
+        return x[:, None] if x.ndim == 1 and x.size == S else x
+
+    def evaluate(self, confidence=0.95):
+        """ BudgetSummary of all the instruments """
+        u = np.abs(self.sensitivity*self.values/self.divisor)
+        u2 = u*u
+        uc2 = u2.sum(axis=0)
+        dof = np.broadcast_to(self.dof, u.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Type B sources (nu = inf) add nothing to the denominator
+            denominator = np.sum(np.where(np.isinf(dof), 0.0, u2*u2/dof),
+                                 axis=0)
+            nu_eff = np.floor(uc2*uc2/denominator)
+            percent = 100*u2/uc2
+        k = t_value(confidence, np.maximum(nu_eff, 1))
+        uc = np.sqrt(uc2)
+        return BudgetSummary(uc, nu_eff, k, k*uc, u, percent)
+
+    def table(self, result=None, contributions=False):
+        """ columns of the summary, one row per instrument, or of the
+        contributions, one row per (instrument, source) """
+        r = self.evaluate() if result is None else result
+        if not contributions:
+            return {'instrument': np.asarray(self.instruments),
+                    'uc': r.uc, 'nu_eff': r.nu_eff, 'k': r.k, 'U': r.U}
+        S, n = r.u.shape
+        return {'instrument': np.tile(np.asarray(self.instruments), S),
+                'source': np.repeat(np.asarray(self.sources), n),
+                'u': r.u.ravel(), 'percent': r.percent.ravel()}
+
+    def export(self, path, result=None, contributions=False):
+        """ write table() to .csv or .parquet in one call (needs pandas,
+        and pyarrow or fastparquet for Parquet) """
+        import pandas as pd
+
+        frame = pd.DataFrame(self.table(result, contributions))
+        if os.path.splitext(path)[1] == '.parquet':
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False)
+        return path
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from scipy import stats
+
+    # surface_roughness_budget.ipynb: repeatability and six Type B sources
+    measurements = np.array([1.58, 1.62, 1.59, 1.61, 1.64, 1.57, 1.60, 1.63,
+                             1.58, 1.61])
+    n = measurements.size
+    u_A = np.std(measurements, ddof=1)/np.sqrt(n)
+    names = ['Repeatability', 'Instrument calibration', 'Stylus tip radius',
+             'Measurement force', 'Environmental vibration',
+             'Temperature variation', 'Digital filtering']
+    values = [u_A, 0.025, 0.020, 0.015, 0.012, 0.008, 0.010]
+    budget = UncertaintyBudget(
+        names, values, divisors(['normal', 'normal-k2'] + ['rectangular']*5),
+        dof=[n - 1] + [np.inf]*6)
+    r = budget.evaluate()
+    nu = r.uc[0]**4/(u_A**4/(n - 1))
+    k = 2.0 if nu >= 30 else stats.t.ppf(0.975, nu)
+    np.testing.assert_allclose(r.uc, np.sqrt(np.sum(
+        np.array(values)**2/budget.divisor[:, 0]**2)))
+    print('Ra budget: u_c = %.5f um, nu_eff = %d (%.2f), k = %.3f (%.3f), '
+          'U = %.4f um' % (r.uc[0], r.nu_eff[0], nu, r.k[0], k, r.U[0]))
+
+    # hot-wire_uncertainty_budget.ipynb: 24 standard uncertainties [%]
+    u = [0.35, 0.75, 1.25, 3.00, 2.00, 1.25, 1.00, 0.65, 0.06, 0.30, 3.50,
+         1.25, 1.25, 0.30, 0.60, 3.00, 3.00, 6.00, 1.25, 1.25, 0.30, 1.25,
+         1.25, 6.00]
+    r = UncertaintyBudget(range(24), u).evaluate()
+    print('hot-wire: u_c = %.2f %%, U = %.2f %% (k = %.2f)'
+          % (r.uc[0], r.U[0], r.k[0]))
+
+    # 20000 instruments with their own certificates and repeatability
+    rng = np.random.default_rng(24)
+    I = 20000
+    values = np.vstack([rng.uniform(0.005, 0.03, I),
+                        rng.uniform(0.01, 0.03, (6, I))])
+    dof = np.vstack([rng.integers(2, 30, I), np.full((6, I), np.inf)])
+    budget = UncertaintyBudget(names, values, budget.divisor, dof)
+    tic = time.perf_counter()
+    r = budget.evaluate()
+    t_eval = time.perf_counter() - tic
+    nu = r.uc**4/(values[0]**4/dof[0])
+    np.testing.assert_allclose(r.k, stats.t.ppf(0.975, np.floor(nu)))
+    with tempfile.TemporaryDirectory() as folder:
+        tic = time.perf_counter()
+        budget.export(os.path.join(folder, 'budgets.csv'), r)
+        budget.export(os.path.join(folder, 'sources.csv'), r, True)
+        t_csv = time.perf_counter() - tic
+        try:
+            budget.export(os.path.join(folder, 'sources.parquet'), r, True)
+        except ImportError:
+            print('no Parquet engine (pyarrow or fastparquet) installed')
+    print('%d budgets of %d sources in %.3f s, %d + %d CSV rows in %.2f s'
+          % (I, len(names), t_eval, I, I*len(names), t_csv))
@@ -0,0 +1,138 @@
+""" Windowed amplitude and power spectra of many channels at once
+
+signal_processing/Fourier_transform_with_windowing.ipynb crops the record
+to 2**fix(log2(N)) samples to get a power of two FFT, which throws away up
+to half of the data, and builds the Hann window, its correction sqrt(8/3)
+and the frequency axis again for every record. Here the whole record is
+used and zero padded to a fast FFT length (scipy.fft.next_fast_len, any
+product of 2, 3, 5, 7, 11), and the window with its correction factors is
+computed once per (window, length):
+
+    from window_spectrum import spectrum
+    f, A = spectrum(g, fs)                        # amplitudes [V]
+    f, P = spectrum(X, fs, axis=0, scaling='psd')  # channels in columns
+
+scaling
+    'amplitude' : the amplitude of a sine, |X_k| 2/sum(w), the DC bin is
+                  the mean that was removed (detrend) or |X_0|/sum(w)
+    'psd'       : one sided power spectral density [V^2/Hz],
+                  |X_k|^2 2/(fs sum(w^2)), as scipy.signal.periodogram
+
+The window is broadcast along the axis of the channels, not tiled, and
+with overwrite=True the record itself is detrended and windowed in place.
+"""
+from functools import lru_cache
+
+import numpy as np
+from scipy import fft, signal
+
+
+@lru_cache(maxsize=128)
+def window(name, n):
+    """ read-only window of length n, amplitude and power sums
+
+    Returns (w, sum(w), sum(w^2)), name is anything scipy.signal.get_window
+    accepts (a hashable: 'hann', ('kaiser', 8.6), ...)
+    """
+    w = signal.get_window(name, n)
+    w.flags.writeable = False
+    return w, w.sum(), np.dot(w, w)
+
+
+def spectrum(x, fs, window_name='hann', axis=-1, nfft=None, detrend=True,
+             scaling='amplitude', overwrite=False):
+    """ single sided spectrum of x along axis
+
+    Inputs:
+        x : record(s), any shape
+        fs : sampling frequency [Hz]
+        window_name : window of scipy.signal.get_window, 'boxcar' for none
+        axis : the time axis, the others are channels
+        nfft : FFT length, next_fast_len(n) by default; n gives bins at
+            exactly k fs/n
+        detrend : remove the mean of every channel first
+        scaling : 'amplitude' or 'psd', see the module help
+        overwrite : detrend and window x in place (x must be a float array)
+
+    Returns:
+        f (nfft//2 + 1,) [Hz], spectrum with the time axis replaced by f
+    """
+    x = np.asarray(x)
+    if not overwrite or x.dtype.kind != 'f':
+        x = x.astype(float)
+    n = x.shape[axis]
+    nfft = fft.next_fast_len(n, real=True) if nfft is None else nfft
+    w, s1, s2 = window(window_name, n)
+    shape = [1]*x.ndim
+    shape[axis] = n
+    w = w.reshape(shape)
+
+    if detrend:
+        mean = x.mean(axis=axis, keepdims=True)
+        x -= mean
+    x *= w
+    X = np.abs(fft.rfft(x, nfft, axis=axis, overwrite_x=True))
+    f = fft.rfftfreq(nfft, 1./fs)
+
+    # the DC and (even nfft) the Nyquist bin are not doubled
+    edges = [0] if nfft % 2 else [0, -1]
+    single = [slice(None)]*x.ndim
+    single[axis] = edges
+    if scaling == 'amplitude':
+        X *= 2./s1
+        X[tuple(single)] /= 2
+        if detrend:
+            first = [slice(None)]*x.ndim
+            first[axis] = slice(0, 1)
+            X[tuple(first)] = np.abs(mean)
+    elif scaling == 'psd':
+        X **= 2
+        X *= 2./(fs*s2)
+        X[tuple(single)] /= 2
+    else:
+        raise ValueError("scaling must be 'amplitude' or 'psd'")
+    return f, X
+
+
+if __name__ == '__main__':
+    import os
+    import time
+
+    # Fourier_transform_with_windowing.ipynb: 301 samples at 100 Hz
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'data', 'FFT_Example_data_with_window.txt')
+    g = np.loadtxt(path)
+    f_s = 100.0
+    f, A = spectrum(g, f_s)
+    print('%d samples in an FFT of %d instead of %d, df = %.3f Hz'
+          % (g.size, 2*(f.size - 1), 2**int(np.log2(g.size)), f[1]))
+    print('DC = %.3f V, largest peak %.3f V at %.2f Hz'
+          % (A[0], A[1:].max(), f[1 + np.argmax(A[1:])]))
+
+    # a sine of 2.5 V on a bin is measured exactly with the boxcar window
+    fs, n = 1000., 1200
+    t = np.arange(n)/fs
+    x = 1.0 + 2.5*np.sin(2*np.pi*50*t)
+    f, A = spectrum(x, fs, 'boxcar', nfft=n)
+    np.testing.assert_allclose([A[0], A[60]], [1.0, 2.5])
+    f, A = spectrum(x, fs, 'hann', nfft=n)
+    np.testing.assert_allclose(A[60], 2.5)
+
+    # psd of the channels in columns, as scipy.signal.periodogram
+    rng = np.random.default_rng(18)
+    X = rng.normal(0, 1, (3001, 64))
+    f, P = spectrum(X, fs, axis=0, scaling='psd')
+    f_ref, P_ref = signal.periodogram(X, fs, 'hann', nfft=2*(f.size - 1),
+                                      axis=0)
+    np.testing.assert_allclose(P, P_ref, rtol=1e-10, atol=1e-15)
+
+    # 256 channels x 10^5 samples, a prime length
+    X = rng.normal(0, 1, (256, 100003))
+    tic = time.perf_counter()
+    f, A = spectrum(X, 1e4, overwrite=True)
+    t_fast = time.perf_counter() - tic
+    tic = time.perf_counter()
+    np.abs(fft.rfft(X, axis=-1))
+    print('256 x 100003 samples: %.2f s padded to %d, %.2f s plain rfft'
+          % (t_fast, 2*(f.size - 1), time.perf_counter() - tic))
+    print('window cache:', window.cache_info())